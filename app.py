@@ -1,24 +1,130 @@
 import flask
-import os, time
+import os, hmac, math, select, socket
 import database.db as db
+import database.tenants as tenants
+import database.seed as seed
+import database.results as results
+import database.search as search_index
+import database.slow as slow
+import database.reset as reset
+import database.version as version
+import database.tuning as tuning
+import lab.boot as boot
+import lab.admission as admission
+import lab.assets as assets
+import lab.metrics as metrics
+import lab.pagecache as pagecache
+import lab.profiling as profiling
+import lab.reqlog as reqlog
+import lab.sandbox as sandbox
+import lab.secrets as secrets
 import mysql.connector
 from datetime import timedelta
 
 
 app = flask.Flask(__name__)
-app.secret_key = os.urandom(24).hex()
 
 app.permanent_session_lifetime = timedelta(minutes=5)
 
-FLAG_1 = f"FLAG{{{os.urandom(12).hex()}}}"
+metrics.init_app(app)
+reqlog.init_app(app)
+assets.init_app(app)
+profiling.init_app(app)
+secrets.init_app(app, db.get_db_connection)
+
+# Unset disables the admin endpoints entirely.
+ADMIN_TOKEN = os.environ.get("LAB_ADMIN_TOKEN")
+
+# Challenges built on SLEEP(), INTO DUMPFILE and UDFs, which the embedded
+# database does not have.
+MYSQL_ONLY = ("sqli_time", "sqli_to_rce", "sqli_rce_exec")
+
+
+def claimed_team():
+    return flask.request.headers.get("X-Lab-Team") or flask.request.args.get("team")
+
+
+def current_team():
+    team = claimed_team()
+    if team:
+        flask.session["team"] = team
+    elif "team" not in flask.session:
+        flask.session["team"] = os.urandom(8).hex()
+    return flask.session["team"]
+
+
+# Registered before admission control, so disabled challenges cost no slot.
+@app.before_request
+def mysql_only():
+    if db.ENGINE == "sqlite" and flask.request.endpoint in MYSQL_ONLY:
+        return "This challenge needs the MySQL backend", 404
+
+
+def known_team():
+    # The session's team only if its cookie came with the request; one
+    # current_team() mints is new for every cookieless client.
+    return claimed_team() or flask.session.get("team")
+
+
+admission.init_app(app, known_team)
+
+
+def lab_database():
+    if not db.TENANT_MODE:
+        return None
+    return tenants.get_schema(current_team())
+
+
+def lab_backend():
+    if len(db.BACKENDS) == 1:
+        return None
+    # Sticky per team, so its injected state stays on one server.
+    return db.backend_for(current_team())
+
+
+def client_disconnected(environ):
+    sock = environ.get("werkzeug.socket") or environ.get("gunicorn.socket")
+    if sock is None:
+        return False
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+    except (OSError, ValueError):
+        return True
+
+
+def db_error_message(e):
+    if isinstance(e, mysql.connector.Error):
+        return f"Database error: {str(e)}"
+    return f"An unexpected error occurred: {str(e)}"
+
+
+def render_blogs(blogs, error, search):
+    response = flask.Response(
+        flask.stream_template("blog.html", blogs=blogs, error=error, search=search)
+    )
+    if isinstance(blogs, results.RowStream):
+        response.call_on_close(blogs.close)
+    return response
+
+
+@app.errorhandler(db.DatabaseUnavailable)
+def database_unavailable(e):
+    return (
+        "The lab database is unavailable, try again shortly",
+        503,
+        {"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+    )
 
 
 @app.route("/", methods=["GET", "POST"])
+@pagecache.cached()
 def home():
-    return flask.render_template("home.html")
+    return flask.render_template("home.html", engine=db.ENGINE)
 
 
 @app.route("/sqli/basic/profile", methods=["GET"])
+@pagecache.cached(session_keys=("username", "secret"))
 def profile():
     username = flask.session.get("username", "Guest")
     secret = flask.session.get("secret")
@@ -26,6 +132,7 @@ def profile():
 
 
 @app.route("/sqli/basic", methods=["GET", "POST"])
+@pagecache.cached()
 def sqli_basic():
     error = None
     if flask.request.method == "POST":
@@ -34,7 +141,7 @@ def sqli_basic():
 
         if username and password:
 
-            conn = db.get_db_connection()
+            conn = db.get_db_connection(lab_database(), backend=lab_backend())
             cursor = conn.cursor(dictionary=True)
 
             try:
@@ -42,17 +149,13 @@ def sqli_basic():
                     f"SELECT * FROM users WHERE username = '{username}' AND password = '{password}'"
                 )
 
-                user = cursor.fetchall()
-                if user:
-                    user = user[0]
-                else:
-                    user = None
+                user = cursor.fetchone()
 
-                print(f"User: {user}")
+                reqlog.record(type="login", route="sqli_basic", user=user)
                 if user:
                     flask.session["username"] = user.get("username")
                     if user.get("role") == "admin":
-                        flask.session["secret"] = FLAG_1
+                        flask.session["secret"] = secrets.get("flag_1")
                     else:
                         flask.session["secret"] = None
                     return flask.redirect("/sqli/basic/profile")
@@ -61,8 +164,7 @@ def sqli_basic():
             except Exception:
                 error = f"Internal Server Error"
             finally:
-                cursor.close()
-                conn.close()
+                results.close(conn, cursor)
 
     return flask.render_template("login.html", error=error)
 
@@ -76,22 +178,22 @@ def sqli_union():
 
     if search:
 
-        conn = db.get_db_connection()
+        conn = db.get_db_connection(lab_database(), backend=lab_backend())
         cursor = conn.cursor(dictionary=True)
 
         try:
             cursor.execute(
-                f"SELECT title, author_name FROM blogs WHERE title LIKE '%{search}%'"
+                f"SELECT title, author_name FROM blogs WHERE {search_index.title_filter(search)}"
             )
 
-            blogs = cursor.fetchall()
+            blogs = results.RowStream(
+                conn, cursor, error_message=lambda e: "Internal Server Error"
+            )
         except Exception:
             error = f"Internal Server Error"
-        finally:
-            cursor.close()
-            conn.close()
+            results.close(conn, cursor)
 
-    return flask.render_template("blog.html", blogs=blogs, error=error, search=search)
+    return render_blogs(blogs, error, search)
 
 
 @app.route("/sqli/error", methods=["GET"])
@@ -102,78 +204,94 @@ def sqli_error():
     search = flask.request.args.get("search", "")
 
     if search:
-        conn = db.get_db_connection()
+        conn = db.get_db_connection(lab_database(), backend=lab_backend())
         cursor = conn.cursor(dictionary=True)
 
         try:
             cursor.execute(
-                f"SELECT title, author_name FROM blogs WHERE title LIKE '%{search}%'"
+                f"SELECT title, author_name FROM blogs WHERE {search_index.title_filter(search)}"
             )
 
-            blogs = cursor.fetchall()
+            blogs = results.RowStream(conn, cursor, error_message=db_error_message)
         except mysql.connector.Error as e:
             error = f"Database error: {str(e)}"
+            results.close(conn, cursor)
         except Exception as e:
             error = f"An unexpected error occurred: {str(e)}"
-        finally:
-            cursor.close()
-            conn.close()
+            results.close(conn, cursor)
 
-    return flask.render_template("blog.html", blogs=blogs, error=error, search=search)
+    return render_blogs(blogs, error, search)
 
 
 @app.route("/sqli/boolean", methods=["GET"])
+@pagecache.cached()
 def sqli_boolean():
     search = flask.request.args.get("search", "")
     res = "Not found"
     if search != "":
 
-        conn = db.get_db_connection()
+        conn = db.get_db_connection(lab_database(), backend=lab_backend())
         cursor = conn.cursor(dictionary=True)
 
         try:
             cursor.execute(f"SELECT * FROM users WHERE username = '{search}'")
-            user = cursor.fetchall()
-            if user:
+            if cursor.fetchone():
                 res = "Found"
 
             return flask.render_template(
                 "user.html", search=search, result=res, show_result=True
             )
         except Exception as e:
-            print("Error:", e)
+            reqlog.record(
+                type="error",
+                route="sqli_boolean",
+                error=type(e).__name__,
+                message=str(e),
+            )
             return flask.render_template(
                 "user.html", search=search, result=res, show_result=True
             )
         finally:
-            cursor.close()
-            conn.close()
+            results.close(conn, cursor)
 
     return flask.render_template("user.html", search=search, show_result=True)
 
 
 @app.route("/sqli/time", methods=["GET"])
+@pagecache.cached()
 def sqli_time():
     search = flask.request.args.get("search", "")
     if search != "":
-
-        conn = db.get_db_connection()
-        cursor = conn.cursor(dictionary=True)
+        environ = flask.request.environ
 
         try:
-            start = time.time()
-            cursor.execute(f"SELECT * FROM users WHERE username = '{search}'")
-            end = time.time()
-            print("Query delay:", end - start)
+            found, delay = slow.run(
+                lab_database(),
+                f"SELECT * FROM users WHERE username = '{search}'",
+                client_gone=lambda: client_disconnected(environ),
+                backend=lab_backend(),
+            )
+            reqlog.record(
+                type="query_delay",
+                route="sqli_time",
+                duration_ms=round(delay * 1000, 3),
+            )
 
-            if cursor.fetchall():
+            if found:
                 return flask.render_template("user.html", search=search, result="Found")
+        except db.DatabaseUnavailable:
+            raise
+        except slow.Busy:
+            return (
+                "Too many time-based queries in progress, try again shortly",
+                503,
+                {"Retry-After": "1"},
+            )
         except Exception as e:
-            print("Error:", e)
+            reqlog.record(
+                type="error", route="sqli_time", error=type(e).__name__, message=str(e)
+            )
             return flask.render_template("user.html", search=search, result="Not found")
-        finally:
-            cursor.close()
-            conn.close()
 
     return flask.render_template("user.html", search=search)
 
@@ -186,26 +304,35 @@ def sqli_to_rce():
     search = flask.request.args.get("search", "")
 
     if search:
-        conn = db.get_db_connection()
+        conn = db.get_db_connection(lab_database(), backend=lab_backend())
         cursor = conn.cursor(dictionary=True)
 
         try:
             cursor.execute(
-                f"SELECT title, author_name FROM blogs WHERE title LIKE '%{search}%'"
+                f"SELECT title, author_name FROM blogs WHERE {search_index.title_filter(search)}"
             )
 
-            blogs = cursor.fetchall()
+            blogs = results.RowStream(conn, cursor, error_message=db_error_message)
         except mysql.connector.Error as e:
-            print(f"Database error: {str(e)}")
+            reqlog.record(
+                type="error",
+                route="sqli_to_rce",
+                error=type(e).__name__,
+                message=str(e),
+            )
             error = f"Database error: {str(e)}"
+            results.close(conn, cursor)
         except Exception as e:
-            print(f"An unexpected error occurred: {str(e)}")
+            reqlog.record(
+                type="error",
+                route="sqli_to_rce",
+                error=type(e).__name__,
+                message=str(e),
+            )
             error = f"An unexpected error occurred: {str(e)}"
-        finally:
-            cursor.close()
-            conn.close()
+            results.close(conn, cursor)
 
-    return flask.render_template("blog.html", blogs=blogs, error=error, search=search)
+    return render_blogs(blogs, error, search)
 
 
 @app.route("/sqli/rce/exec", methods=["GET"])
@@ -213,19 +340,150 @@ def sqli_rce_exec():
     file = flask.request.args.get("file", "")
     if file:
         try:
-            exec(open(f"{file}.py").read())
+            sandbox.run(f"{file}.py")
             return "File executed successfully", 200
         except FileNotFoundError:
             return "File not found", 404
+        except sandbox.Busy:
+            return (
+                "Too many files being executed, try again shortly",
+                503,
+                {"Retry-After": "1"},
+            )
         except Exception as e:
             return f"Error executing file: {str(e)}", 500
     else:
         return "'file' parameter is required", 400
 
 
-if __name__ == "__main__":
-    db.main()
-    with db.get_db_connection() as conn:
+def require_admin():
+    if not ADMIN_TOKEN:
+        flask.abort(404)
+    token = flask.request.headers.get("X-Lab-Admin-Token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        flask.abort(403)
+
+
+@app.route("/admin/reset", methods=["POST"])
+def admin_reset():
+    require_admin()
+    return flask.jsonify(reset.reset(flask.request.values.get("team")))
+
+
+@app.route("/admin/profile", methods=["GET", "POST", "DELETE"])
+def admin_profile():
+    require_admin()
+    if flask.request.method == "GET":
+        return flask.Response(profiling.collapsed(), mimetype="text/plain")
+    if flask.request.method == "DELETE":
+        profiling.configure(0)
+    else:
+        values = flask.request.values
+        if values.get("clear") == "1":
+            profiling.clear()
+        try:
+            profiling.configure(
+                float(values.get("rate", profiling.DEFAULT_RATE)),
+                values.get("route") or None,
+                float(values.get("duration", profiling.DEFAULT_DURATION)),
+            )
+        except ValueError:
+            flask.abort(400)
+    return flask.jsonify(profiling.status())
+
+
+@app.route("/admin/secrets", methods=["GET", "POST"])
+def admin_secrets():
+    require_admin()
+    if flask.request.method == "POST":
+        names = flask.request.values.get("names")
+        names = names.split(",") if names else secrets.NAMES
+        try:
+            secrets.rotate(names)
+        except ValueError:
+            flask.abort(400)
+        # The flag table is what the injections read.
+        if "flag_2" in names:
+            if db.ENGINE == "sqlite":
+                reset.reset_embedded()
+            else:
+                db.for_each_backend(version.update_flag)
+    return flask.jsonify(secrets.status())
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return "ok", 200
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    status = boot.report()
+    status["backends"] = {}
+    for backend in db.BACKENDS:
+        try:
+            conn = db.get_db_connection(backend=backend)
+            conn.close()
+            state = "ok"
+        except Exception as e:
+            state = str(e)
+        status["backends"][backend] = {
+            "database": state,
+            "breaker": db.breaker_stats(backend)["state"],
+        }
+    ok = boot.ready and all(
+        backend["database"] == "ok" for backend in status["backends"].values()
+    )
+    return flask.jsonify(status), 200 if ok else 503
+
+
+def bootstrap_backend(backend):
+    def phase(name):
+        return boot.phase(name if len(db.BACKENDS) == 1 else f"{name}@{backend}")
+
+    with phase("wait_for_database"):
+        expected = version.expected()
+        current = version.current(backend)
+
+    if current == expected:
+        # Baked image or restart: the data is already in place.
+        with phase("refresh_secrets"):
+            version.refresh_secrets(backend)
+    else:
+        with phase("init_database"):
+            db.main(backend)
+        with phase("seed"):
+            seed.main(backend)
+        # Built after the bulk load, and before the copies that inherit it.
+        if search_index.ENABLED:
+            with phase("search_index"):
+                search_index.main(backend)
+        if db.TENANT_MODE:
+            with phase("tenants"):
+                tenants.main(backend)
+        with phase("snapshot"):
+            reset.snapshot(backend=backend)
+        version.record(expected, backend)
+
+
+def bootstrap():
+    # Generated by the first process of the deployment, read by the others.
+    with boot.phase("secrets"):
+        if secrets.STORE == "db":
+            db.wait_for_database().close()
+        secrets.values()
+
+    if db.ENGINE == "sqlite":
+        # Nothing to wait for, keep or check: the tables are rebuilt at every
+        # start in well under a second.
+        with boot.phase("init_database"):
+            db.main()
+        return
+
+    # Backends are prepared in parallel.
+    db.for_each_backend(bootstrap_backend)
+
+    with boot.phase("system_info"), db.get_db_connection() as conn:
         with conn.cursor() as cursor:
             cursor.execute(
                 "SELECT @@secure_file_priv, @@plugin_dir, USER(), CURRENT_USER(), SYSTEM_USER()"
@@ -241,4 +499,19 @@ if __name__ == "__main__":
             else:
                 print("Failed to retrieve MySQL system information")
 
+            # The profile is sized for this host, so only a local server is
+            # expected to match it.
+            if db.BACKENDS[0].rsplit(":", 1)[0] in reset.LOCAL_HOSTS:
+                _, settings = tuning.profile()
+                wanted = tuning.expected(settings, tuning.read_base())
+                for name, live, value in tuning.check(cursor, wanted):
+                    print(
+                        f"[WARN] MySQL {name} is {live}, the tuned profile wants {value}"
+                    )
+
+
+if __name__ == "__main__":
+    bootstrap()
+    boot.mark_ready()
+    profiling.install_signals()
     app.run(host="0.0.0.0", port=1303)
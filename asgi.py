@@ -0,0 +1,400 @@
+import os, io, sys, time, asyncio
+import flask
+from werkzeug.exceptions import HTTPException
+import app as lab
+import database.db as db
+import database.aio as aio
+import database.search as search_index
+import database.slow as slow
+import lab.boot as boot
+import lab.pagecache as pagecache
+import lab.profiling as profiling
+import lab.reqlog as reqlog
+import lab.secrets as secrets
+
+HOST = os.environ.get("LAB_HOST", "0.0.0.0")
+PORT = int(os.environ.get("LAB_PORT", "1303"))
+BACKLOG = int(os.environ.get("LAB_BACKLOG", "2048"))
+
+# Requests holding or waiting for a slow connection.
+_time_in_flight = 0
+
+
+async def connection_args():
+    # Tenant schemas may have to be cloned first, which is blocking work.
+    database = await asyncio.to_thread(lab.lab_database) if db.TENANT_MODE else None
+    return database, lab.lab_backend()
+
+
+def render_blogs(blogs, error, search):
+    return flask.render_template("blog.html", blogs=blogs, error=error, search=search)
+
+
+@pagecache.cached()
+async def sqli_basic(receive):
+    error = None
+    if flask.request.method == "POST":
+        username = flask.request.form.get("username")
+        password = flask.request.form.get("password")
+
+        if username and password:
+            database, backend = await connection_args()
+            async with aio.Query(database, backend=backend) as query:
+                try:
+                    await query.execute(
+                        f"SELECT * FROM users WHERE username = '{username}' AND password = '{password}'"
+                    )
+
+                    user = await query.fetchone()
+
+                    reqlog.record(type="login", route="sqli_basic", user=user)
+                    if user:
+                        flask.session["username"] = user.get("username")
+                        if user.get("role") == "admin":
+                            flask.session["secret"] = secrets.get("flag_1")
+                        else:
+                            flask.session["secret"] = None
+                        return flask.redirect("/sqli/basic/profile")
+                    else:
+                        error = "Invalid credentials"
+                except Exception:
+                    error = f"Internal Server Error"
+
+    return flask.render_template("login.html", error=error)
+
+
+async def sqli_union(receive):
+    blogs = []
+    error = None
+
+    search = flask.request.args.get("search", "")
+
+    if search:
+        database, backend = await connection_args()
+        async with aio.Query(database, backend=backend) as query:
+            try:
+                await query.execute(
+                    f"SELECT title, author_name FROM blogs WHERE {search_index.title_filter(search)}"
+                )
+
+                blogs = await aio.fetch_rows(
+                    query, error_message=lambda e: "Internal Server Error"
+                )
+            except Exception:
+                error = f"Internal Server Error"
+
+    return render_blogs(blogs, error, search)
+
+
+async def sqli_error(receive):
+    blogs = []
+    error = None
+
+    search = flask.request.args.get("search", "")
+
+    if search:
+        database, backend = await connection_args()
+        async with aio.Query(database, backend=backend) as query:
+            try:
+                await query.execute(
+                    f"SELECT title, author_name FROM blogs WHERE {search_index.title_filter(search)}"
+                )
+
+                blogs = await aio.fetch_rows(query, error_message=lab.db_error_message)
+            except Exception as e:
+                error = lab.db_error_message(e)
+
+    return render_blogs(blogs, error, search)
+
+
+@pagecache.cached()
+async def sqli_boolean(receive):
+    search = flask.request.args.get("search", "")
+    res = "Not found"
+    if search != "":
+        database, backend = await connection_args()
+        async with aio.Query(database, backend=backend) as query:
+            try:
+                await query.execute(f"SELECT * FROM users WHERE username = '{search}'")
+                if await query.fetchone():
+                    res = "Found"
+            except Exception as e:
+                reqlog.record(
+                    type="error",
+                    route="sqli_boolean",
+                    error=type(e).__name__,
+                    message=str(e),
+                )
+        return flask.render_template(
+            "user.html", search=search, result=res, show_result=True
+        )
+
+    return flask.render_template("user.html", search=search, show_result=True)
+
+
+async def client_disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def run_slow(database, sql, receive, backend):
+    state = {}
+
+    async def first_row():
+        async with aio.Query(database, pool="slow", backend=backend) as query:
+            state["query"] = query
+            start = time.perf_counter()
+            await query.execute(sql)
+            row = await query.fetchone()
+            return row is not None, time.perf_counter() - start
+
+    task = asyncio.ensure_future(first_row())
+    gone = asyncio.ensure_future(client_disconnected(receive))
+    try:
+        await asyncio.wait({task, gone}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        query = state.get("query")
+        if query is None or query.cnx is None:
+            # Still waiting for a connection, nothing runs on the server yet.
+            task.cancel()
+        else:
+            # The SLEEP() ends and the connection goes back to the pool.
+            await aio.kill(query.connection_id, backend)
+        await asyncio.gather(task, return_exceptions=True)
+        raise slow.ClientGone("Client disconnected")
+    finally:
+        gone.cancel()
+        task.cancel()
+
+
+@pagecache.cached()
+async def sqli_time(receive):
+    global _time_in_flight
+    search = flask.request.args.get("search", "")
+    if search != "":
+        if _time_in_flight >= aio.SLOW_POOL_SIZE + aio.TIME_QUEUE:
+            return (
+                "Too many time-based queries in progress, try again shortly",
+                503,
+                {"Retry-After": "1"},
+            )
+        _time_in_flight += 1
+        try:
+            database, backend = await connection_args()
+            found, delay = await run_slow(
+                database,
+                f"SELECT * FROM users WHERE username = '{search}'",
+                receive,
+                backend,
+            )
+            reqlog.record(
+                type="query_delay",
+                route="sqli_time",
+                duration_ms=round(delay * 1000, 3),
+            )
+
+            if found:
+                return flask.render_template("user.html", search=search, result="Found")
+        except db.DatabaseUnavailable:
+            raise
+        except Exception as e:
+            reqlog.record(
+                type="error", route="sqli_time", error=type(e).__name__, message=str(e)
+            )
+            return flask.render_template("user.html", search=search, result="Not found")
+        finally:
+            _time_in_flight -= 1
+
+    return flask.render_template("user.html", search=search)
+
+
+async def sqli_to_rce(receive):
+    blogs = []
+    error = None
+
+    search = flask.request.args.get("search", "")
+
+    if search:
+        database, backend = await connection_args()
+        async with aio.Query(database, backend=backend) as query:
+            try:
+                await query.execute(
+                    f"SELECT title, author_name FROM blogs WHERE {search_index.title_filter(search)}"
+                )
+
+                blogs = await aio.fetch_rows(query, error_message=lab.db_error_message)
+            except Exception as e:
+                reqlog.record(
+                    type="error",
+                    route="sqli_to_rce",
+                    error=type(e).__name__,
+                    message=str(e),
+                )
+                error = lab.db_error_message(e)
+
+    return render_blogs(blogs, error, search)
+
+
+# Endpoints that wait on MySQL run on the event loop; everything else is
+# served by the Flask app itself on a worker thread.
+VIEWS = {
+    "sqli_basic": sqli_basic,
+    "sqli_union": sqli_union,
+    "sqli_error": sqli_error,
+    "sqli_boolean": sqli_boolean,
+    "sqli_time": sqli_time,
+    "sqli_to_rce": sqli_to_rce,
+}
+# The embedded database has no asyncio driver; Flask serves every route.
+if db.ENGINE == "sqlite":
+    VIEWS = {}
+
+
+def wsgi_environ(scope, body):
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode().decode("latin-1"),
+        "PATH_INFO": scope["path"].encode().decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "lab.async": True,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        value = value.decode("latin-1")
+        environ[name] = f"{environ[name]},{value}" if name in environ else value
+    return environ
+
+
+def call_wsgi(environ):
+    started = []
+
+    def start_response(status, headers, exc_info=None):
+        started[:] = [status, headers]
+
+    iterable = lab.app(environ, start_response)
+    try:
+        body = b"".join(iterable)
+    finally:
+        if hasattr(iterable, "close"):
+            iterable.close()
+    return started[0], started[1], body
+
+
+async def dispatch(view, environ, receive):
+    # The same request lifecycle as Flask.wsgi_app, so sessions, admission,
+    # metrics and the request log behave as in the threaded server.
+    with lab.app.request_context(environ):
+        try:
+            rv = lab.app.preprocess_request()
+            if rv is None:
+                rv = await view(receive)
+            response = lab.app.finalize_request(rv)
+        except Exception as e:
+            try:
+                response = lab.app.finalize_request(lab.app.handle_user_exception(e))
+            except Exception as unhandled:
+                response = lab.app.handle_exception(unhandled)
+        iterable, status, headers = response.get_wsgi_response(environ)
+        try:
+            body = b"".join(iterable)
+        finally:
+            response.close()
+    return status, headers, body
+
+
+def native_view(environ):
+    try:
+        endpoint, _ = lab.app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None
+    return VIEWS.get(endpoint)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await aio.close_pools()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return None
+
+    body = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+
+    environ = wsgi_environ(scope, b"".join(body))
+    view = native_view(environ)
+    if view is None:
+        status, headers, body = await asyncio.to_thread(call_wsgi, environ)
+    else:
+        status, headers, body = await dispatch(view, environ, receive)
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": int(status.split(" ", 1)[0]),
+            "headers": [
+                (name.lower().encode("latin-1"), value.encode("latin-1"))
+                for name, value in headers
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+    return None
+
+
+def main():
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit(
+            "[ERROR] The async server needs uvicorn: pip install -r requirements.txt"
+        )
+
+    lab.bootstrap()
+    boot.mark_ready()
+    profiling.install_signals()
+    print(f"[INFO] Serving asynchronously on {HOST}:{PORT}")
+    uvicorn.run(
+        app,
+        host=HOST,
+        port=PORT,
+        backlog=BACKLOG,
+        lifespan="on",
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import json, time, random, argparse
+import mysql.connector
+import database.db as db
+import database.seed as seed
+from bench.loadgen import percentile
+
+SCHEMA = "sqli_lab_bench_ids"
+LAYOUTS = ("uuid", "binary")
+
+
+def connect(backend, database=None):
+    config = db.backend_config(backend or db.BACKENDS[0])
+    if database:
+        config["database"] = database
+    return mysql.connector.connect(**config)
+
+
+def index_sizes(cursor):
+    # Persistent statistics are refreshed by ANALYZE TABLE; sizes are pages.
+    cursor.execute("ANALYZE TABLE users")
+    cursor.fetchall()
+    cursor.execute(
+        "SELECT index_name, stat_value * @@innodb_page_size"
+        " FROM mysql.innodb_index_stats"
+        " WHERE database_name = %s AND table_name = 'users' AND stat_name = 'size'",
+        (SCHEMA,),
+    )
+    return {name: int(size) for name, size in cursor.fetchall()}
+
+
+def lookups(cursor, users, count, seed_value):
+    # The sqli_basic/sqli_boolean/sqli_time statement for existing users.
+    rng = random.Random(seed_value)
+    latencies = []
+    for _ in range(count):
+        username = f"user{rng.randrange(users):07d}"
+        start = time.perf_counter()
+        cursor.execute(f"SELECT * FROM users WHERE username = '{username}'")
+        cursor.fetchall()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95": round(percentile(latencies, 0.95) * 1000, 3),
+    }
+
+
+def measure(conn, id_layout, users, count, seed_value):
+    db.create_tables(conn, id_layout=id_layout)
+    progress = seed.Progress(f"users ({id_layout})", users)
+    start = time.perf_counter()
+    seed.insert_rows(
+        conn,
+        "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
+        seed.user_rows(users, seed_value),
+        progress,
+    )
+    elapsed = time.perf_counter() - start
+    cursor = conn.cursor()
+    try:
+        sizes = index_sizes(cursor)
+        cursor.execute("SELECT id FROM users LIMIT 1")
+        sample = cursor.fetchone()[0]
+        return {
+            "layout": id_layout,
+            "rows": users,
+            "insert_rows_per_s": round(users / elapsed),
+            "primary_bytes": sizes.get("PRIMARY", 0),
+            "username_bytes": sizes.get("username", 0),
+            "lookup_ms": lookups(cursor, users, count, seed_value),
+            "sample_id": sample,
+        }
+    finally:
+        cursor.close()
+
+
+def run(users, count, seed_value, backend=None):
+    admin = connect(backend)
+    cursor = admin.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{SCHEMA}`")
+    cursor.close()
+    admin.close()
+
+    conn = connect(backend, SCHEMA)
+    try:
+        return [
+            measure(conn, id_layout, users, count, seed_value) for id_layout in LAYOUTS
+        ]
+    finally:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{SCHEMA}`")
+        cursor.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the CHAR(36) and BINARY(16) users.id layouts"
+    )
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=seed.SEED)
+    parser.add_argument("--backend", help="host:port, the first backend by default")
+    parser.add_argument("--output", help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    results = run(args.users, args.lookups, args.seed, args.backend)
+
+    print(
+        f"{'layout':<8}{'rows/s':>10}  {'PRIMARY':>10}  {'username':>10}  "
+        f"{'lookup p50':>11}  {'p95':>9}  id"
+    )
+    for result in results:
+        print(
+            f"{result['layout']:<8}{result['insert_rows_per_s']:>10,}  "
+            f"{result['primary_bytes'] / 2**20:>8.1f}MB  "
+            f"{result['username_bytes'] / 2**20:>8.1f}MB  "
+            f"{result['lookup_ms']['p50']:>9.3f}ms  "
+            f"{result['lookup_ms']['p95']:>7.3f}ms  {result['sample_id']}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
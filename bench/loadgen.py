@@ -0,0 +1,370 @@
+import os, sys, json, time, random, argparse, threading, subprocess
+import http.client
+from urllib.parse import urlsplit, quote
+
+SCENARIOS = {
+    "home": ("GET", "/", None),
+    "login": ("POST", "/sqli/basic", {"username": "alice", "password": "wrong"}),
+    "profile": ("GET", "/sqli/basic/profile", None),
+    "union_search": ("GET", "/sqli/union?search=" + quote("Python"), None),
+    "union_dump": (
+        "GET",
+        "/sqli/union?search=" + quote("' union select flag, 1 from flag -- -"),
+        None,
+    ),
+    "error_search": ("GET", "/sqli/error?search=" + quote("Docker"), None),
+    "error_payload": (
+        "GET",
+        "/sqli/error?search="
+        + quote("' and extractvalue(1, concat(0x7e, (select flag from flag))) -- -"),
+        None,
+    ),
+    "boolean_lookup": ("GET", "/sqli/boolean?search=alice", None),
+    "boolean_probe": (
+        "GET",
+        "/sqli/boolean?search="
+        + quote("admin' and substring((select flag from flag), 1, 1) = 'F' -- -"),
+        None,
+    ),
+    "time_lookup": ("GET", "/sqli/time?search=alice", None),
+    "time_sleep": (
+        "GET",
+        "/sqli/time?search=" + quote("alice' and sleep(0.5) -- -"),
+        None,
+    ),
+}
+
+MIXES = {
+    "default": {
+        "home": 10,
+        "login": 5,
+        "profile": 5,
+        "union_search": 20,
+        "union_dump": 5,
+        "error_search": 10,
+        "error_payload": 5,
+        "boolean_lookup": 15,
+        "boolean_probe": 15,
+        "time_lookup": 8,
+        "time_sleep": 2,
+    },
+    "benign": {
+        "home": 20,
+        "profile": 10,
+        "union_search": 30,
+        "error_search": 20,
+        "boolean_lookup": 10,
+        "time_lookup": 10,
+    },
+    "slow": {"time_sleep": 50, "union_search": 25, "boolean_lookup": 25},
+}
+
+
+def parse_mix(value):
+    if value in MIXES:
+        return MIXES[value]
+    if os.path.exists(value):
+        with open(value) as f:
+            return json.load(f)
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario: {name}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(latencies, errors, rejected, elapsed):
+    latencies = sorted(latencies)
+    total = len(latencies)
+    return {
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+        "error_rate": round(errors / total, 4) if total else 0,
+        "errors": errors,
+        "rejected": rejected,
+        "latency_ms": {
+            "mean": round(sum(latencies) / total * 1000, 2) if total else None,
+            "p50": round(percentile(latencies, 0.50) * 1000, 2) if total else None,
+            "p95": round(percentile(latencies, 0.95) * 1000, 2) if total else None,
+            "p99": round(percentile(latencies, 0.99) * 1000, 2) if total else None,
+            "max": round(latencies[-1] * 1000, 2) if total else None,
+        },
+    }
+
+
+class HttpTransport:
+    def __init__(self, base_url, timeout):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip("/")
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def request(self, method, path, form):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+        body, headers = None, {}
+        if form is not None:
+            body = "&".join(f"{quote(k)}={quote(v)}" for k, v in form.items())
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        try:
+            conn.request(method, self.prefix + path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.getheader("Connection", "").lower() == "close":
+                conn.close()
+                self.local.conn = None
+            return response.status
+        except Exception:
+            conn.close()
+            self.local.conn = None
+            raise
+
+
+class InProcessTransport:
+    def __init__(self):
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import app as lab
+
+        self.app = lab.app
+        self.local = threading.local()
+
+    def request(self, method, path, form):
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.app.test_client()
+        response = client.open(path, method=method, data=form)
+        response.get_data()
+        response.close()
+        return response.status_code
+
+
+def fetch_metrics(base_url, timeout):
+    parts = urlsplit(base_url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=timeout)
+    try:
+        conn.request("GET", parts.path.rstrip("/") + "/metrics")
+        response = conn.getresponse()
+        text = response.read().decode()
+        if response.status != 200:
+            return None
+    except OSError:
+        return None
+    finally:
+        conn.close()
+
+    pool = {}
+    for line in text.splitlines():
+        if line.startswith("lab_db_pool_connections{"):
+            labels, _, value = line.rpartition(" ")
+            pool[labels[len("lab_db_pool_connections") :]] = float(value)
+    return pool
+
+
+def mysql_status():
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        import mysql.connector
+        import database.db as db
+
+        conn = mysql.connector.connect(**db.DB_CONFIG)
+    except Exception as e:
+        return {"error": str(e)}
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SHOW GLOBAL STATUS WHERE Variable_name IN "
+            "('Threads_connected', 'Threads_running', 'Max_used_connections', "
+            "'Connections', 'Aborted_connects', 'Questions')"
+        )
+        return {name: int(value) for name, value in cursor.fetchall()}
+    finally:
+        conn.close()
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(transport, mix, concurrency, duration, requests, warmup, seed):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    lock = threading.Lock()
+    issued = [0]
+    results = {name: {"latencies": [], "errors": 0, "rejected": 0} for name in names}
+    peak = {"threads_connected": 0}
+
+    def worker(index):
+        rng = random.Random(f"{seed}:{index}")
+        deadline = time.monotonic() + duration if duration else None
+        local = {name: {"latencies": [], "errors": 0, "rejected": 0} for name in names}
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            if requests:
+                with lock:
+                    if issued[0] >= requests:
+                        break
+                    issued[0] += 1
+            name = rng.choices(names, weights)[0]
+            method, path, form = SCENARIOS[name]
+            start = time.perf_counter()
+            try:
+                status = transport.request(method, path, form)
+            except Exception:
+                status = None
+            elapsed = time.perf_counter() - start
+            bucket = local[name]
+            bucket["latencies"].append(elapsed)
+            if status is None or (status >= 500 and status != 503):
+                bucket["errors"] += 1
+            elif status in (429, 503):
+                bucket["rejected"] += 1
+        with lock:
+            for name, bucket in local.items():
+                results[name]["latencies"] += bucket["latencies"]
+                results[name]["errors"] += bucket["errors"]
+                results[name]["rejected"] += bucket["rejected"]
+
+    if warmup:
+        for name in names:
+            method, path, form = SCENARIOS[name]
+            for _ in range(warmup):
+                try:
+                    transport.request(method, path, form)
+                except Exception:
+                    pass
+
+    threads = [
+        threading.Thread(target=worker, args=(i,), daemon=True)
+        for i in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    stop = threading.Event()
+
+    def sample_connections():
+        while not stop.wait(0.5):
+            status = mysql_status()
+            if "Threads_connected" in status:
+                peak["threads_connected"] = max(
+                    peak["threads_connected"], status["Threads_connected"]
+                )
+
+    sampler = threading.Thread(target=sample_connections, daemon=True)
+    sampler.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    stop.set()
+
+    all_latencies = [l for bucket in results.values() for l in bucket["latencies"]]
+    report = summarize(
+        all_latencies,
+        sum(bucket["errors"] for bucket in results.values()),
+        sum(bucket["rejected"] for bucket in results.values()),
+        elapsed,
+    )
+    report["duration_s"] = round(elapsed, 3)
+    report["peak_threads_connected"] = peak["threads_connected"]
+    report["scenarios"] = {
+        name: summarize(
+            bucket["latencies"], bucket["errors"], bucket["rejected"], elapsed
+        )
+        for name, bucket in results.items()
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the SQLi lab routes")
+    parser.add_argument("--url", default="http://127.0.0.1:1303")
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="drive app.app through Flask's test client instead of HTTP",
+    )
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument(
+        "--requests", type=int, default=0, help="stop after this many requests"
+    )
+    parser.add_argument(
+        "--mix",
+        default="default",
+        help=f"one of {', '.join(MIXES)}, a JSON file or name=weight,...",
+    )
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1303)
+    parser.add_argument("--output", help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    duration = 0 if args.requests else args.duration
+    if args.in_process:
+        transport = InProcessTransport()
+    else:
+        transport = HttpTransport(args.url, args.timeout)
+
+    before = mysql_status()
+    pool_before = None if args.in_process else fetch_metrics(args.url, args.timeout)
+    report = run(
+        transport,
+        mix,
+        args.concurrency,
+        duration,
+        args.requests,
+        args.warmup,
+        args.seed,
+    )
+    after = mysql_status()
+    pool_after = None if args.in_process else fetch_metrics(args.url, args.timeout)
+
+    report["config"] = {
+        "target": "in-process" if args.in_process else args.url,
+        "concurrency": args.concurrency,
+        "duration_s": duration,
+        "requests": args.requests,
+        "mix": mix,
+        "seed": args.seed,
+        "revision": git_revision(),
+    }
+    report["db"] = {"before": before, "after": after}
+    if "Connections" in before and "Connections" in after:
+        report["db"]["new_connections"] = after["Connections"] - before["Connections"]
+    report["pool"] = {"before": pool_before, "after": pool_after}
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import sys, json, asyncio, argparse
+from http.cookies import SimpleCookie
+from urllib.parse import quote, urlencode, urlsplit
+import app as lab
+import asgi
+import lab.admission as admission
+from bench.loadgen import SCENARIOS
+
+# Each case is a list of requests sharing one cookie jar; only the last
+# response is compared, so earlier steps can log in first.
+CASES = {
+    **{name: [request] for name, request in SCENARIOS.items()},
+    "login_admin": [
+        ("POST", "/sqli/basic", {"username": "admin' -- -", "password": "x"})
+    ],
+    "login_error": [
+        ("POST", "/sqli/basic", {"username": "'", "password": "'"}),
+    ],
+    "profile_admin": [
+        ("POST", "/sqli/basic", {"username": "admin' -- -", "password": "x"}),
+        ("GET", "/sqli/basic/profile", None),
+    ],
+    "union_columns": [
+        ("GET", "/sqli/union?search=" + quote("' order by 3 -- -"), None)
+    ],
+    "union_users": [
+        (
+            "GET",
+            "/sqli/union?search="
+            + quote("' union select username, password from users -- -"),
+            None,
+        )
+    ],
+    "error_syntax": [("GET", "/sqli/error?search=" + quote("'"), None)],
+    "boolean_false": [
+        ("GET", "/sqli/boolean?search=" + quote("admin' and 1=2 -- -"), None)
+    ],
+    "boolean_error": [("GET", "/sqli/boolean?search=" + quote("'"), None)],
+    "time_error": [("GET", "/sqli/time?search=" + quote("'"), None)],
+    "time_empty": [("GET", "/sqli/time", None)],
+    "rce_search": [("GET", "/sqli/rce?search=" + quote("Python"), None)],
+    "rce_error": [("GET", "/sqli/rce?search=" + quote("'"), None)],
+    "rce_exec_missing": [("GET", "/sqli/rce/exec?file=/nonexistent", None)],
+    "not_found": [("GET", "/no/such/page", None)],
+    "wrong_method": [("DELETE", "/sqli/union", None)],
+}
+
+COMPARED_HEADERS = ("Content-Type", "Location", "Retry-After")
+
+
+def wsgi_request(client, method, path, form):
+    response = client.open(
+        path, method=method, data=form, headers={"X-Lab-Team": "parity"}
+    )
+    headers = {name: response.headers.get(name) for name in COMPARED_HEADERS}
+    return response.status_code, headers, response.get_data()
+
+
+async def asgi_request(cookies, method, path, form):
+    parts = urlsplit(path)
+    body = urlencode(form).encode() if form is not None else b""
+    headers = [(b"host", b"localhost"), (b"x-lab-team", b"parity")]
+    if form is not None:
+        headers.append((b"content-type", b"application/x-www-form-urlencoded"))
+        headers.append((b"content-length", str(len(body)).encode()))
+    if cookies:
+        cookie = "; ".join(f"{name}={morsel.value}" for name, morsel in cookies.items())
+        headers.append((b"cookie", cookie.encode()))
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": parts.path,
+        "root_path": "",
+        "query_string": parts.query.encode(),
+        "headers": headers,
+        "server": ("localhost", 80),
+        "client": ("127.0.0.1", 40000),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+    done = asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        # The client stays connected until the response is complete.
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+        if message["type"] == "http.response.body" and not message.get("more_body"):
+            done.set()
+
+    await asgi.app(scope, receive, send)
+    start = sent[0]
+    response_headers = {}
+    for name, value in start["headers"]:
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        if name == "set-cookie":
+            cookies.load(value)
+        response_headers.setdefault(name, value)
+    headers = {name: response_headers.get(name.lower()) for name in COMPARED_HEADERS}
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    return start["status"], headers, body
+
+
+async def run(cases):
+    # One event loop for the whole run: the async pools belong to it.
+    differences = {}
+    for name in cases:
+        client = lab.app.test_client()
+        cookies = SimpleCookie()
+        for method, path, form in CASES[name]:
+            expected = wsgi_request(client, method, path, form)
+            actual = await asgi_request(cookies, method, path, form)
+        if expected != actual:
+            differences[name] = {
+                "wsgi": [expected[0], expected[1], expected[2][:2000].decode()],
+                "asgi": [actual[0], actual[1], actual[2][:2000].decode()],
+            }
+        print(f"{'ok  ' if expected == actual else 'DIFF'} {name} -> {expected[0]}")
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Check that the ASGI server renders the same pages as app.py"
+    )
+    parser.add_argument(
+        "cases", nargs="*", help=f"cases to run (default: all of {', '.join(CASES)})"
+    )
+    args = parser.parse_args()
+
+    # Pages are compared, not rate limits.
+    admission.ENABLED = False
+    differences = asyncio.run(run(args.cases or list(CASES)))
+    if differences:
+        print(json.dumps(differences, indent=2))
+        sys.exit(1)
+    print(f"All {len(args.cases or CASES)} cases match")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+import sys, json, time, argparse
+import mysql.connector
+import database.db as db
+import database.seed as seed
+import database.reset as reset
+import database.search as search
+from bench.loadgen import percentile
+
+SCHEMA = "sqli_lab_bench_search"
+# Where the indexed table is copied the way snapshots, spares and tenants are.
+COPY_SCHEMA = "sqli_lab_bench_search_copy"
+# From a word in every twentieth title, through rarer phrases, to no match.
+TERMS = ["Python", "Kafka Profiling", "Hidden Rust Indexing Deep Dive", "Haskell"]
+
+
+def connect(backend, database=None):
+    config = db.backend_config(backend or db.BACKENDS[0])
+    if database:
+        config["database"] = database
+    return mysql.connector.connect(**config)
+
+
+def load(conn, size, seed_value):
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS blogs")
+    cursor.execute(
+        """
+        CREATE TABLE blogs (
+            id INT PRIMARY KEY AUTO_INCREMENT,
+            title VARCHAR(200) NOT NULL,
+            author_name VARCHAR(50),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+    cursor.close()
+    authors = [username for username, _ in db.USERS_DATA]
+    seed.insert_rows(
+        conn,
+        "INSERT INTO blogs (title, author_name) VALUES (%s, %s)",
+        seed.blog_rows(size, seed_value, authors),
+        seed.Progress(f"blogs ({size:,})", size),
+    )
+
+
+def measure(cursor, sql, repeat):
+    # The statement the route runs, with every row read as the page would.
+    latencies = []
+    rows = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql)
+        rows = len(cursor.fetchall())
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return rows, {
+        "p50": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95": round(percentile(latencies, 0.95) * 1000, 2),
+    }
+
+
+def indexed_sql(term):
+    return "SELECT title, author_name FROM blogs WHERE " + search.title_filter(term)
+
+
+def copy_matches(backend, repeat):
+    # A new session has the server's default stopword setting, as the
+    # connections making the copies do.
+    conn = connect(backend, COPY_SCHEMA)
+    cursor = conn.cursor()
+    try:
+        reset.copy_tables(cursor, SCHEMA, COPY_SCHEMA, ["blogs"])
+        return {term: measure(cursor, indexed_sql(term), repeat)[0] for term in TERMS}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def run(sizes, repeat, seed_value, backend=None):
+    admin = connect(backend)
+    cursor = admin.cursor()
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{SCHEMA}`")
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{COPY_SCHEMA}`")
+    cursor.close()
+    admin.close()
+
+    conn = connect(backend, SCHEMA)
+    results = []
+    try:
+        for size in sizes:
+            load(conn, size, seed_value)
+            cursor = conn.cursor()
+            scan = {
+                term: measure(
+                    cursor,
+                    f"SELECT title, author_name FROM blogs WHERE title LIKE '%{term}%'",
+                    repeat,
+                )
+                for term in TERMS
+            }
+            start = time.perf_counter()
+            search.create_index(cursor)
+            build_seconds = time.perf_counter() - start
+            copied = copy_matches(backend, 1)
+            for term in TERMS:
+                indexed = measure(cursor, indexed_sql(term), repeat)
+                results.append(
+                    {
+                        "rows": size,
+                        "term": term,
+                        "matches": scan[term][0],
+                        "same_rows": scan[term][0] == indexed[0],
+                        "copy_same_rows": scan[term][0] == copied[term],
+                        "scan_ms": scan[term][1],
+                        "indexed_ms": indexed[1],
+                        "index_build_s": round(build_seconds, 2),
+                    }
+                )
+            cursor.close()
+    finally:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{SCHEMA}`")
+        cursor.execute(f"DROP DATABASE IF EXISTS `{COPY_SCHEMA}`")
+        cursor.close()
+        conn.close()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the blog search with and without the FULLTEXT index"
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000,1000000",
+        help="comma-separated blog table sizes to measure",
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=seed.SEED)
+    parser.add_argument("--backend", help="host:port, the first backend by default")
+    parser.add_argument("--output", help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    # Measure the indexed statements whatever LAB_SEARCH_INDEX says.
+    search.ENABLED = True
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = run(sizes, args.repeat, args.seed, args.backend)
+
+    print(
+        f"{'rows':>10}  {'term':<32}{'matches':>9}  {'scan p50':>10}  "
+        f"{'index p50':>10}  {'speedup':>8}"
+    )
+    for result in results:
+        scan, indexed = result["scan_ms"]["p50"], result["indexed_ms"]["p50"]
+        print(
+            f"{result['rows']:>10,}  {result['term']:<32}{result['matches']:>9,}  "
+            f"{scan:>8.2f}ms  {indexed:>8.2f}ms  {scan / max(indexed, 0.01):>7.1f}x"
+            f"{'' if result['same_rows'] else '  ROWS DIFFER'}"
+            f"{'' if result['copy_same_rows'] else '  COPY ROWS DIFFER'}"
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+    sys.exit(
+        0
+        if all(result["same_rows"] and result["copy_same_rows"] for result in results)
+        else 1
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+import os, time, asyncio
+import mysql.connector, mysql.connector.aio
+import database.db as db
+import database.results as results
+import lab.metrics as metrics
+import lab.pagecache as pagecache
+import lab.profiling as profiling
+import lab.reqlog as reqlog
+
+# Connections are the scarce part in async mode: thousands of requests can
+# wait on the event loop, only this many talk to MySQL at once.
+POOL_SIZE = int(os.environ.get("LAB_ASYNC_POOL_SIZE", str(db.POOL_SIZE)))
+SLOW_POOL_SIZE = int(os.environ.get("LAB_ASYNC_SLOW_POOL_SIZE", "64"))
+TIME_QUEUE = int(os.environ.get("LAB_ASYNC_TIME_QUEUE", "4096"))
+
+POOLS = {
+    "default": {"size": POOL_SIZE},
+    # Time-based requests queue for a connection instead of failing after
+    # DB_POOL_TIMEOUT; TIME_QUEUE bounds how many may wait.
+    "slow": {
+        "size": SLOW_POOL_SIZE,
+        "timeout": None,
+        "session_variables": {"max_execution_time": db.SLOW_QUERY_TIMEOUT_MS},
+    },
+}
+
+
+class AsyncPool:
+    def __init__(self, size, timeout, name, backend, session_variables=None):
+        self.size = size
+        self.timeout = timeout
+        self.name = name
+        self.labels = (("pool", f"async_{name}"), ("backend", backend))
+        self.config = db.backend_config(backend)
+        self.session_variables = session_variables or {}
+        self.idle = []
+        # asyncio.Semaphore binds to the running loop on first use.
+        self.slots = asyncio.Semaphore(size)
+
+    async def _connect(self):
+        cnx = await mysql.connector.aio.connect(**self.config)
+        try:
+            await self._apply_session(cnx)
+        except BaseException:
+            try:
+                await cnx.close()
+            except Exception:
+                pass
+            raise
+        metrics.add("lab_db_pool_connections", (*self.labels, ("state", "open")))
+        return cnx
+
+    async def _apply_session(self, cnx):
+        if not self.session_variables:
+            return
+        cursor = await cnx.cursor()
+        await cursor.execute(
+            "SET "
+            + ", ".join(f"SESSION {name} = %s" for name in self.session_variables),
+            tuple(self.session_variables.values()),
+        )
+        await cursor.close()
+
+    async def _close(self, cnx):
+        metrics.add("lab_db_pool_connections", (*self.labels, ("state", "open")), -1)
+        try:
+            await cnx.close()
+        except Exception:
+            pass
+
+    async def get_connection(self, database=None):
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise mysql.connector.errors.PoolError(
+                "Failed getting connection; pool exhausted"
+            )
+        metrics.observe(
+            "lab_db_pool_wait_seconds", time.monotonic() - start, self.labels
+        )
+
+        cnx = None
+        try:
+            cnx = self.idle.pop() if self.idle else None
+            if cnx is not None:
+                # Same checks as the threaded pool: selecting the schema
+                # doubles as the liveness check.
+                try:
+                    if database or db.TENANT_MODE:
+                        await cnx.cmd_init_db(database or self.config["database"])
+                    elif not await cnx.is_connected():
+                        raise mysql.connector.errors.InterfaceError("Disconnected")
+                except (
+                    mysql.connector.errors.OperationalError,
+                    mysql.connector.errors.InterfaceError,
+                ):
+                    await self._close(cnx)
+                    cnx = None
+            if cnx is None:
+                cnx = await self._connect()
+                if database:
+                    await cnx.cmd_init_db(database)
+        except BaseException:
+            # E.g. a tenant schema the sweeper dropped: the session still
+            # holds its socket and counts as open.
+            if cnx is not None:
+                await self._close(cnx)
+            self.slots.release()
+            raise
+
+        metrics.add("lab_db_pool_connections", (*self.labels, ("state", "in_use")))
+        elapsed = time.monotonic() - start
+        metrics.observe("lab_db_connect_seconds", elapsed, self.labels)
+        profiling.phase("connect", elapsed)
+        return cnx
+
+    async def release(self, cnx, discard=False):
+        metrics.add("lab_db_pool_connections", (*self.labels, ("state", "in_use")), -1)
+        try:
+            if discard or cnx.unread_result:
+                await self._close(cnx)
+                return
+            await cnx.cmd_reset_connection()
+            await self._apply_session(cnx)
+            self.idle.append(cnx)
+        except Exception:
+            await self._close(cnx)
+        finally:
+            self.slots.release()
+
+
+_pools = {}
+
+
+def get_pool(name="default", backend=None):
+    # One event loop per process, so the pools need no lock.
+    backend = backend or db.BACKENDS[0]
+    pool = _pools.get((name, backend))
+    if pool is None:
+        options = POOLS[name]
+        pool = _pools[(name, backend)] = AsyncPool(
+            options["size"],
+            options.get("timeout", db.POOL_TIMEOUT),
+            name,
+            backend,
+            options.get("session_variables"),
+        )
+    return pool
+
+
+async def close_pools():
+    pools = list(_pools.values())
+    _pools.clear()
+    for pool in pools:
+        while pool.idle:
+            await pool._close(pool.idle.pop())
+
+
+def _forget_pools_after_fork():
+    _pools.clear()
+
+
+os.register_at_fork(after_in_child=_forget_pools_after_fork)
+
+
+async def get_db_connection(database=None, pool="default", backend=None):
+    pagecache.uncacheable()
+    backend = backend or db.BACKENDS[0]
+    breaker = db.BREAKERS[backend]
+    breaker.before()
+    try:
+        cnx = await get_pool(pool, backend).get_connection(database)
+    except mysql.connector.errors.PoolError:
+        breaker.abandon()
+        raise
+    except mysql.connector.errors.ProgrammingError:
+        breaker.success()
+        raise
+    except mysql.connector.Error as e:
+        breaker.failure(e)
+        raise db.DatabaseUnavailable(
+            f"Failed to connect to the database: {str(e)}", db.BREAKER_BACKOFF
+        ) from e
+    except Exception as e:
+        breaker.failure(e)
+        raise
+    except BaseException:
+        # Cancelled while connecting; let the next caller probe.
+        breaker.abandon()
+        raise
+    breaker.success()
+    return cnx
+
+
+class Rows(list):
+    # What the blog template needs from results.RowStream, fully read.
+    truncated = False
+    error = None
+
+
+class Query:
+    """A pooled connection for one statement, instrumented like the sync cursor."""
+
+    def __init__(self, database=None, pool="default", backend=None):
+        self.database = database
+        self.pool = get_pool(pool, backend)
+        self.backend = backend or db.BACKENDS[0]
+        self.cnx = None
+        self.cursor = None
+        self.statement = None
+        self.error = None
+        self.execute_seconds = 0.0
+        self.fetch_seconds = 0.0
+        self.rows = 0
+
+    async def __aenter__(self):
+        self.cnx = await get_db_connection(self.database, self.pool.name, self.backend)
+        return self
+
+    @property
+    def connection_id(self):
+        return self.cnx.connection_id
+
+    async def _call(self, coroutine):
+        try:
+            return await coroutine
+        except Exception as e:
+            metrics.inc("lab_db_errors_total", db.error_labels(e))
+            self.error = type(e).__name__
+            raise
+
+    async def execute(self, statement):
+        self.cursor = await self.cnx.cursor(dictionary=True)
+        self.statement = statement
+        start = time.perf_counter()
+        try:
+            await self._call(self.cursor.execute(statement))
+        finally:
+            self.execute_seconds = time.perf_counter() - start
+            profiling.phase("execute", self.execute_seconds)
+            metrics.observe(
+                "lab_db_execute_seconds", self.execute_seconds, self.pool.labels
+            )
+
+    async def fetchone(self):
+        start = time.perf_counter()
+        try:
+            row = await self._call(self.cursor.fetchone())
+        finally:
+            elapsed = time.perf_counter() - start
+            profiling.phase("fetch", elapsed)
+            self.fetch_seconds += elapsed
+        if row is not None:
+            self.rows += 1
+        return row
+
+    def finish(self):
+        if self.statement is None:
+            return
+        metrics.observe("lab_db_fetch_seconds", self.fetch_seconds, self.pool.labels)
+        metrics.observe(
+            "lab_db_rows", self.rows, self.pool.labels, buckets=metrics.ROW_BUCKETS
+        )
+        reqlog.record(
+            type="query",
+            route=reqlog.current_route(),
+            pool=self.pool.labels[0][1],
+            query=self.statement,
+            duration_ms=round((self.execute_seconds + self.fetch_seconds) * 1000, 3),
+            rows=self.rows,
+            error=self.error,
+        )
+        self.statement = None
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.finish()
+        cnx, self.cnx = self.cnx, None
+        # A cancelled read leaves the protocol mid-packet.
+        discard = isinstance(exc, asyncio.CancelledError)
+        try:
+            drained = 0
+            while not discard and cnx.unread_result and drained < results.DRAIN_ROWS:
+                if await self.cursor.fetchone() is None:
+                    break
+                drained += 1
+            if self.cursor is not None and not cnx.unread_result and not discard:
+                await self.cursor.close()
+        except Exception:
+            discard = True
+        await self.pool.release(cnx, discard=discard)
+
+
+async def fetch_rows(
+    query,
+    max_rows=results.MAX_ROWS,
+    max_bytes=results.MAX_BYTES,
+    error_message=lambda e: f"Database error: {str(e)}",
+):
+    # Mirrors RowStream: an error on the first row is the caller's to report,
+    # later ones end the list and are shown under it.
+    rows = Rows()
+    row = await query.fetchone()
+    size = 0
+    try:
+        while row is not None:
+            row_bytes = results.row_size(row)
+            if len(rows) >= max_rows or size + row_bytes > max_bytes:
+                rows.truncated = True
+                break
+            rows.append(row)
+            size += row_bytes
+            row = await query.fetchone()
+    except Exception as e:
+        rows.error = error_message(e)
+    return rows
+
+
+async def kill(connection_id, backend=None):
+    async with Query(backend=backend) as query:
+        await query.execute(f"KILL QUERY {int(connection_id)}")
@@ -1,24 +1,825 @@
-import os, time
-import mysql.connector, mysql.connector.abstracts
+import os, time, random, sqlite3, hashlib, threading
+from bisect import bisect
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import mysql.connector, mysql.connector.abstracts, mysql.connector.pooling
+import database.sqlite as sqlite
+import lab.metrics as metrics
+import lab.pagecache as pagecache
+import lab.profiling as profiling
+import lab.reqlog as reqlog
+import lab.secrets as secrets
 
-FLAG_2 = f"FLAG{{{os.urandom(12).hex()}}}"
+DB_CONFIG = {
+    "host": "127.0.0.1",
+    "port": 3306,
+    "database": "sqli_lab",
+    "user": "root",
+    "password": "root",
+}
 
+# "mysql", or "sqlite" for a single process with an embedded database and
+# only the challenges that do not depend on MySQL itself.
+ENGINE = os.environ.get("LAB_DB_ENGINE", "mysql")
 
-def get_db_connection():
-    for _ in range(10):
+# Comma-separated host:port list. Teams are spread over the backends by
+# consistent hashing; the first one also serves requests without a team.
+BACKENDS = (
+    ["sqlite"]
+    if ENGINE == "sqlite"
+    else [
+        backend.strip()
+        for backend in os.environ.get(
+            "LAB_DB_BACKENDS", f"{DB_CONFIG['host']}:{DB_CONFIG['port']}"
+        ).split(",")
+        if backend.strip()
+    ]
+)
+RING_REPLICAS = 160
+
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "32"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+
+# Connection budget for the time-based challenge, kept apart from the main
+# pool so SLEEP() payloads cannot hold every connection.
+SLOW_POOL_SIZE = int(os.environ.get("DB_SLOW_POOL_SIZE", "8"))
+SLOW_QUERY_TIMEOUT_MS = int(os.environ.get("LAB_TIME_MAX_EXECUTION_MS", "10000"))
+
+# "uuid" keeps users.id as CHAR(36); "binary" clusters the table on a
+# time-ordered BINARY(16) key and derives the same text id from it.
+ID_LAYOUT = os.environ.get("LAB_USER_ID_LAYOUT", "uuid")
+
+TENANT_MODE = ENGINE == "mysql" and os.environ.get("LAB_TENANT_MODE", "0") == "1"
+
+# Consecutive connection failures before requests stop waiting on MySQL, and
+# the backoff between the probes that check whether it is back.
+BREAKER_FAILURES = int(os.environ.get("DB_BREAKER_FAILURES", "5"))
+BREAKER_BACKOFF = float(os.environ.get("DB_BREAKER_BACKOFF", "0.5"))
+BREAKER_MAX_BACKOFF = float(os.environ.get("DB_BREAKER_MAX_BACKOFF", "30"))
+
+# Boot polls with a short, growing delay instead of a fixed sleep so it
+# notices MySQL within a few milliseconds of it accepting connections.
+BOOT_TIMEOUT = float(os.environ.get("DB_BOOT_TIMEOUT", "90"))
+BOOT_RETRY_DELAY = 0.05
+BOOT_MAX_RETRY_DELAY = 1.0
+
+
+def error_labels(e):
+    if isinstance(e, mysql.connector.Error):
+        kind = "mysql"
+    elif isinstance(e, sqlite3.Error):
+        kind = "sqlite"
+    else:
+        kind = "other"
+    return (("kind", kind), ("error", type(e).__name__))
+
+
+class InstrumentedCursor:
+    def __init__(self, cursor, labels):
+        self._cursor = cursor
+        self._labels = labels
+        self._active = False
+        self._statement = None
+        self._error = None
+        self._execute_seconds = 0.0
+        self._fetch_seconds = 0.0
+        self._rows = 0
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        row = self.fetchone()
+        while row is not None:
+            yield row
+            row = self.fetchone()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _call(self, histogram, method, *args, **kwargs):
+        start = time.perf_counter()
         try:
-            conn = mysql.connector.connect(
-                host="127.0.0.1",
-                port=3306,
-                database="sqli_lab",
-                user="root",
-                password="root",
+            return method(*args, **kwargs)
+        except Exception as e:
+            metrics.inc("lab_db_errors_total", error_labels(e))
+            self._error = type(e).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            if histogram:
+                metrics.observe(histogram, elapsed, self._labels)
+                profiling.phase("execute", elapsed)
+                self._execute_seconds = elapsed
+            else:
+                profiling.phase("fetch", elapsed)
+                self._fetch_seconds += elapsed
+
+    def _start(self, statement):
+        self.finish()
+        self._active = True
+        self._statement = statement
+
+    def execute(self, operation, *args, **kwargs):
+        self._start(operation)
+        return self._call(
+            "lab_db_execute_seconds", self._cursor.execute, operation, *args, **kwargs
+        )
+
+    def executemany(self, operation, *args, **kwargs):
+        self._start(operation)
+        return self._call(
+            "lab_db_execute_seconds",
+            self._cursor.executemany,
+            operation,
+            *args,
+            **kwargs,
+        )
+
+    def fetchone(self):
+        row = self._call(None, self._cursor.fetchone)
+        if row is not None:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._call(None, self._cursor.fetchmany, *args, **kwargs)
+        self._rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._call(None, self._cursor.fetchall)
+        self._rows += len(rows)
+        return rows
+
+    def close(self):
+        self.finish()
+        return self._cursor.close()
+
+    def finish(self):
+        if self._active:
+            self._active = False
+            metrics.observe("lab_db_fetch_seconds", self._fetch_seconds, self._labels)
+            metrics.observe(
+                "lab_db_rows", self._rows, self._labels, buckets=metrics.ROW_BUCKETS
+            )
+            reqlog.record(
+                type="query",
+                route=reqlog.current_route(),
+                pool=self._labels[0][1],
+                query=self._statement,
+                duration_ms=round(
+                    (self._execute_seconds + self._fetch_seconds) * 1000, 3
+                ),
+                rows=self._rows,
+                error=self._error,
             )
-            return conn
+            self._statement = None
+            self._error = None
+            self._execute_seconds = 0.0
+            self._fetch_seconds = 0.0
+            self._rows = 0
+
+
+class PooledConnection:
+    def __init__(self, pool, cnx):
+        self._pool = pool
+        self._cnx = cnx
+        self._cursors = []
+
+    def cursor(self, *args, **kwargs):
+        if self._cnx is None:
+            raise mysql.connector.errors.OperationalError(
+                "MySQL Connection not available"
+            )
+        cursor = InstrumentedCursor(
+            self._cnx.cursor(*args, **kwargs), self._pool.labels
+        )
+        self._cursors.append(cursor)
+        return cursor
+
+    def _finish_cursors(self):
+        for cursor in self._cursors:
+            cursor.finish()
+        self._cursors = []
+
+    def __getattr__(self, name):
+        if self._cnx is None:
+            raise mysql.connector.errors.OperationalError(
+                "MySQL Connection not available"
+            )
+        return getattr(self._cnx, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._cnx is not None:
+            self._finish_cursors()
+            cnx, self._cnx = self._cnx, None
+            self._pool.release(cnx)
+
+    def discard(self):
+        if self._cnx is not None:
+            self._finish_cursors()
+            cnx, self._cnx = self._cnx, None
+            self._pool.discard(cnx)
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        size,
+        timeout,
+        name="default",
+        pin_database=False,
+        session_variables=None,
+        backend=None,
+        **config,
+    ):
+        self.name = name
+        self.backend = backend
+        self.labels = (("pool", name), ("backend", backend or config["host"]))
+        self.size = size
+        self.timeout = timeout
+        self.pin_database = pin_database
+        self.session_variables = session_variables or {}
+        self.config = config
+        self._idle = deque()
+        self._created = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "wait_seconds_total": 0.0,
+            "wait_seconds_max": 0.0,
+            "timeouts": 0,
+            "validation_failures": 0,
+            "resets": 0,
+            "discarded": 0,
+        }
+
+    def get_connection(self, database=None):
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while not self._idle and self._created >= self.size:
+                remaining = self.timeout - (time.monotonic() - start)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise mysql.connector.errors.PoolError(
+                        "Failed getting connection; pool exhausted"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            cnx = self._idle.pop() if self._idle else None
+            if cnx is None:
+                self._created += 1
+
+            wait = time.monotonic() - start
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+            self._stats["wait_seconds_total"] += wait
+            self._stats["wait_seconds_max"] = max(self._stats["wait_seconds_max"], wait)
+
+        metrics.observe("lab_db_pool_wait_seconds", wait, self.labels)
+        if cnx is None:
+            metrics.add("lab_db_pool_connections", (*self.labels, ("state", "open")))
+
+        selected = False
+        try:
+            if cnx is None:
+                cnx = mysql.connector.connect(**self.config)
+                self._apply_session(cnx)
+            elif database or self.pin_database:
+                # Selecting the schema doubles as the liveness check and undoes
+                # any USE a previous borrower slipped into a query.
+                try:
+                    cnx.cmd_init_db(database or self.config["database"])
+                    selected = True
+                except (
+                    mysql.connector.errors.OperationalError,
+                    mysql.connector.errors.InterfaceError,
+                ):
+                    with self._cond:
+                        self._stats["validation_failures"] += 1
+                    cnx.reconnect(attempts=1)
+                    self._apply_session(cnx)
+            elif not cnx.is_connected():
+                with self._cond:
+                    self._stats["validation_failures"] += 1
+                cnx.reconnect(attempts=1)
+                self._apply_session(cnx)
+        except Exception:
+            # A reused session that failed, e.g. on a dropped tenant schema,
+            # still holds its socket.
+            if cnx is None:
+                self._forget()
+            else:
+                self._discard(cnx)
+            raise
+
+        metrics.add("lab_db_pool_connections", (*self.labels, ("state", "in_use")))
+        if database and not selected:
+            try:
+                cnx.cmd_init_db(database)
+            except Exception:
+                self.release(cnx)
+                raise
+
+        elapsed = time.monotonic() - start
+        metrics.observe("lab_db_connect_seconds", elapsed, self.labels)
+        profiling.phase("connect", elapsed)
+        return PooledConnection(self, cnx)
+
+    def release(self, cnx):
+        metrics.add("lab_db_pool_connections", (*self.labels, ("state", "in_use")), -1)
+        try:
+            if cnx.unread_result:
+                raise mysql.connector.errors.InternalError("Unread result found")
+            # Drops user variables, SET values, temporary tables and open
+            # transactions so nothing leaks to the next checkout.
+            cnx.cmd_reset_connection()
+            self._apply_session(cnx)
+        except Exception:
+            self._discard(cnx)
+            return
+
+        with self._cond:
+            self._stats["resets"] += 1
+            self._idle.append(cnx)
+            self._cond.notify()
+
+    def _apply_session(self, cnx):
+        if not self.session_variables:
+            return
+        cursor = cnx.cursor()
+        cursor.execute(
+            "SET "
+            + ", ".join(f"SESSION {name} = %s" for name in self.session_variables),
+            tuple(self.session_variables.values()),
+        )
+        cursor.close()
+
+    def discard(self, cnx):
+        metrics.add("lab_db_pool_connections", (*self.labels, ("state", "in_use")), -1)
+        self._discard(cnx)
+
+    def _discard(self, cnx):
+        try:
+            try:
+                cnx.shutdown()
+            except NotImplementedError:
+                cnx.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._stats["discarded"] += 1
+        self._forget()
+
+    def _forget(self):
+        metrics.add("lab_db_pool_connections", (*self.labels, ("state", "open")), -1)
+        with self._cond:
+            self._created -= 1
+            self._cond.notify()
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+            self._created -= len(idle)
+        metrics.add(
+            "lab_db_pool_connections", (*self.labels, ("state", "open")), -len(idle)
+        )
+        for cnx in idle:
+            try:
+                cnx.close()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self._stats,
+                "size": self.size,
+                "open": self._created,
+                "idle": len(self._idle),
+                "in_use": self._created - len(self._idle),
+            }
+
+
+class EmbeddedConnection(sqlite.Connection):
+    labels = (("pool", "embedded"), ("backend", "sqlite"))
+
+    def __init__(self, cnx):
+        super().__init__(cnx)
+        self._cursors = []
+
+    def cursor(self, *args, **kwargs):
+        cursor = InstrumentedCursor(super().cursor(*args, **kwargs), self.labels)
+        self._cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        for cursor in self._cursors:
+            cursor.finish()
+        self._cursors = []
+        super().close()
+
+    discard = close
+
+
+def connect_embedded(writable=False):
+    # No pool: opening an SQLite connection costs less than a checkout.
+    start = time.monotonic()
+    conn = EmbeddedConnection(sqlite.connect(writable))
+    elapsed = time.monotonic() - start
+    metrics.observe("lab_db_connect_seconds", elapsed, EmbeddedConnection.labels)
+    profiling.phase("connect", elapsed)
+    return conn
+
+
+POOLS = {
+    "default": {"size": POOL_SIZE},
+    "slow": {
+        "size": SLOW_POOL_SIZE,
+        "session_variables": {"max_execution_time": SLOW_QUERY_TIMEOUT_MS},
+    },
+}
+
+
+class HashRing:
+    def __init__(self, backends, replicas=RING_REPLICAS):
+        # Every backend owns many small arcs of the ring, so adding one only
+        # takes over its share of teams from each of the others.
+        points = sorted(
+            (self.hash(f"{backend}#{i}"), backend)
+            for backend in backends
+            for i in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.backends = [backend for _, backend in points]
+
+    @staticmethod
+    def hash(key):
+        return int.from_bytes(hashlib.sha1(key.encode()).digest()[:8], "big")
+
+    def lookup(self, key):
+        index = bisect(self.hashes, self.hash(key)) % len(self.hashes)
+        return self.backends[index]
+
+
+RING = HashRing(BACKENDS)
+
+
+def backend_for(team):
+    if team is None or len(BACKENDS) == 1:
+        return BACKENDS[0]
+    return RING.lookup(team)
+
+
+def backend_config(backend):
+    host, _, port = backend.rpartition(":")
+    return {**DB_CONFIG, "host": host, "port": int(port)}
+
+
+def for_each_backend(function, *args, **kwargs):
+    # Seeding, snapshots and resets run on every backend at once.
+    if len(BACKENDS) == 1:
+        return {BACKENDS[0]: function(*args, backend=BACKENDS[0], **kwargs)}
+    with ThreadPoolExecutor(
+        max_workers=len(BACKENDS), thread_name_prefix="backend"
+    ) as executor:
+        futures = {
+            backend: executor.submit(function, *args, backend=backend, **kwargs)
+            for backend in BACKENDS
+        }
+        return {backend: future.result() for backend, future in futures.items()}
+
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+
+def get_pool(name="default", backend=None):
+    backend = backend or BACKENDS[0]
+    pool = _pools.get((name, backend))
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get((name, backend))
+            if pool is None:
+                options = POOLS[name]
+                pool = _pools[(name, backend)] = ConnectionPool(
+                    options["size"],
+                    POOL_TIMEOUT,
+                    name=name,
+                    pin_database=TENANT_MODE,
+                    session_variables=options.get("session_variables"),
+                    backend=backend,
+                    **backend_config(backend),
+                )
+    return pool
+
+
+def pool_stats(name="default", backend=None):
+    return get_pool(name, backend).stats()
+
+
+def close_pools():
+    with _pool_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def _forget_pools_after_fork():
+    # Sockets inherited from the parent belong to the parent's sessions; the
+    # child opens its own connections on first use.
+    global _pool_lock
+    _pool_lock = threading.Lock()
+    _pools.clear()
+
+
+os.register_at_fork(after_in_child=_forget_pools_after_fork)
+
+
+class DatabaseUnavailable(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, backend, failures, backoff, max_backoff):
+        self.backend = backend
+        self.labels = (("backend", backend),)
+        self.threshold = failures
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = 0.0
+        self.changed_at = time.time()
+        self.last_error = None
+
+    def _transition(self, state):
+        if state == self.state:
+            return
+        if self.state == self.CLOSED:
+            metrics.add("lab_db_breaker_open", self.labels)
+        elif state == self.CLOSED:
+            metrics.add("lab_db_breaker_open", self.labels, -1)
+        metrics.inc(
+            "lab_db_breaker_transitions_total", (*self.labels, ("state", state))
+        )
+        reqlog.record(
+            type="breaker",
+            backend=self.backend,
+            previous=self.state,
+            state=state,
+            failures=self.failures,
+            error=self.last_error,
+        )
+        print(
+            f"[INFO] Database circuit breaker for {self.backend} {self.state} -> {state}"
+        )
+        self.state = state
+        self.changed_at = time.time()
+
+    def before(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            if self.state == self.OPEN and now >= self.retry_at:
+                # This caller is the probe; everyone else keeps failing fast
+                # until it reports back.
+                self._transition(self.HALF_OPEN)
+                return
+            retry_after = max(self.retry_at - now, self.backoff)
+        raise DatabaseUnavailable(
+            "Database unavailable, try again shortly", retry_after
+        )
+
+    def success(self):
+        with self.lock:
+            if self.state == self.CLOSED and not self.failures:
+                return
+            self.failures = 0
+            self.trips = 0
+            self._transition(self.CLOSED)
+
+    def abandon(self):
+        # The probe never reached the server; let the next caller try.
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.retry_at = time.monotonic()
+                self._transition(self.OPEN)
+
+    def failure(self, e):
+        with self.lock:
+            self.failures += 1
+            self.last_error = f"{type(e).__name__}: {e}"
+            if self.state == self.CLOSED and self.failures < self.threshold:
+                return
+            delay = min(self.max_backoff, self.backoff * 2**self.trips)
+            self.trips += 1
+            self.retry_at = time.monotonic() + random.uniform(delay / 2, delay)
+            self._transition(self.OPEN)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "trips": self.trips,
+                "retry_in": max(0.0, self.retry_at - time.monotonic()),
+                "changed_at": self.changed_at,
+                "last_error": self.last_error,
+            }
+
+
+# One per backend, shared by its pools: they talk to the same server.
+BREAKERS = {
+    backend: CircuitBreaker(
+        backend, BREAKER_FAILURES, BREAKER_BACKOFF, BREAKER_MAX_BACKOFF
+    )
+    for backend in BACKENDS
+}
+
+
+def breaker_stats(backend=None):
+    return BREAKERS[backend or BACKENDS[0]].stats()
+
+
+def _reset_breakers_after_fork():
+    for backend in BACKENDS:
+        BREAKERS[backend] = CircuitBreaker(
+            backend, BREAKER_FAILURES, BREAKER_BACKOFF, BREAKER_MAX_BACKOFF
+        )
+
+
+os.register_at_fork(after_in_child=_reset_breakers_after_fork)
+
+
+def get_db_connection(database=None, pool="default", backend=None):
+    pagecache.uncacheable()
+    if ENGINE == "sqlite":
+        return connect_embedded()
+    backend = backend or BACKENDS[0]
+    breaker = BREAKERS[backend]
+    breaker.before()
+    try:
+        conn = get_pool(pool, backend).get_connection(database)
+    except mysql.connector.errors.PoolError:
+        breaker.abandon()
+        raise
+    except mysql.connector.errors.ProgrammingError:
+        # An unknown schema still means the server answered.
+        breaker.success()
+        raise
+    except mysql.connector.Error as e:
+        breaker.failure(e)
+        raise DatabaseUnavailable(
+            f"Failed to connect to the database: {str(e)}", BREAKER_BACKOFF
+        ) from e
+    except Exception as e:
+        # Anything else, e.g. a socket error the connector did not wrap, must
+        # still settle a probe or the breaker stays half-open.
+        breaker.failure(e)
+        raise
+    except BaseException:
+        breaker.abandon()
+        raise
+    breaker.success()
+    return conn
+
+
+def wait_for_database(timeout=BOOT_TIMEOUT, backend=None):
+    # Boot happens before any request is served, so it can afford to wait for
+    # MySQL instead of failing fast.
+    if ENGINE == "sqlite":
+        return connect_embedded(writable=True)
+    deadline = time.monotonic() + timeout
+    delay = BOOT_RETRY_DELAY
+    while True:
+        try:
+            return get_pool(backend=backend).get_connection()
+        except mysql.connector.errors.ProgrammingError:
+            raise
         except mysql.connector.Error as e:
-            print(f"Connection failed: {str(e)}. Retrying...")
-            time.sleep(1.5)
-    raise mysql.connector.Error("Failed to connect to the database")
+            if time.monotonic() + delay > deadline:
+                raise mysql.connector.Error("Failed to connect to the database")
+            print(
+                f"Connection to {backend or BACKENDS[0]} failed: {str(e)}. Retrying..."
+            )
+            time.sleep(delay)
+            delay = min(delay * 2, BOOT_MAX_RETRY_DELAY)
+
+
+USERS_DATA = [
+    ("alice", "user"),
+    ("bob", "user"),
+    ("charlie", "user"),
+    ("diana", "user"),
+    ("edward", "user"),
+    ("fiona", "user"),
+    ("george", "user"),
+    ("helen", "user"),
+    ("ivan", "user"),
+    ("julia", "user"),
+    ("kevin", "user"),
+    ("admin", "admin"),
+    ("linda", "user"),
+    ("martin", "user"),
+    ("nancy", "user"),
+    ("oscar", "user"),
+    ("penny", "user"),
+    ("quincy", "user"),
+    ("rachel", "user"),
+    ("steve", "user"),
+    ("tina", "user"),
+    ("victor", "user"),
+    ("wendy", "user"),
+    ("xavier", "user"),
+    ("yvonne", "user"),
+    ("zack", "user"),
+]
+
+# Blogs with author_name matching usernames
+BLOGS_DATA = [
+    ("Basic Python Programming", "alice"),
+    ("Introduction to Docker", "bob"),
+    ("Effective Git Usage Guide", "charlie"),
+    ("5 Python Libraries for Data Science", "diana"),
+    ("Getting Started with ReactJS", "edward"),
+    ("How to Optimize JavaScript Performance", "fiona"),
+    ("Machine Learning for Beginners", "george"),
+    ("REST API with Flask and Python", "helen"),
+    ("CSS Grid vs Flexbox: When to Use What?", "ivan"),
+    ("Web Security: Basic Things You Need to Know", "julia"),
+    ("Node.js and MongoDB: Building Fullstack Applications", "kevin"),
+    ("TypeScript: Why Should You Learn It?", "linda"),
+    ("Basic DevOps: CI/CD with GitHub Actions", "martin"),
+    ("Vue.js 3: Notable New Features", "nancy"),
+    ("SQL Injection and Prevention Methods", "oscar"),
+    ("Redis: Efficient Cache and Session Store", "penny"),
+    ("Design Patterns in OOP Programming", "quincy"),
+    ("Microservices vs Monolith: Which Architecture to Choose?", "rachel"),
+    ("Kubernetes Basics for Developers", "steve"),
+    ("Clean Code: Writing Clean and Maintainable Code", "tina"),
+    ("AWS Lambda: Practical Serverless Computing", "victor"),
+    ("GraphQL vs REST: Detailed Comparison", "wendy"),
+    ("Unit Testing with Jest and Python unittest", "xavier"),
+    ("Blockchain and Smart Contract Basics", "yvonne"),
+    ("Performance Testing with JMeter", "zack"),
+    ("Mobile App Development with React Native", "alice"),
+    ("Data Science with Pandas and NumPy", "bob"),
+    ("Elasticsearch: Data Search and Analysis", "charlie"),
+    ("OAuth 2.0 and JWT in Authentication", "diana"),
+    ("Agile and Scrum: Methodology for Effective Teams", "edward"),
+    ("Progressive Web Apps (PWA): The Future of Web", "fiona"),
+    ("Apache Kafka: Message Queue for Large Systems", "george"),
+    ("Code Review: Best Practices and Tools", "helen"),
+    ("Cyber Security: Protecting Web Applications", "ivan"),
+    ("Flutter vs React Native: Which Framework to Choose?", "julia"),
+    ("Big Data with Apache Spark", "kevin"),
+    ("Monitoring and Logging in Production", "linda"),
+    ("API Design: RESTful Best Practices", "martin"),
+    ("Git Advanced: Rebase, Cherry-pick and Hooks", "nancy"),
+    ("Load Balancing and High Availability", "oscar"),
+    ("Containerization with Docker and Kubernetes", "penny"),
+    ("Microservices Architecture Best Practices", "quincy"),
+    ("Web Security and Penetration Testing", "rachel"),
+    ("Cloud Computing with AWS and Azure", "steve"),
+    ("Database Optimization and Performance Tuning", "tina"),
+    ("Frontend Frameworks: React vs Vue vs Angular", "victor"),
+    ("Backend Development with Node.js and Express", "wendy"),
+    ("Data Analysis with Python and R", "xavier"),
+    ("Mobile Development: Native vs Cross-platform", "yvonne"),
+    ("DevSecOps: Security in CI/CD Pipeline", "zack"),
+]
+
+
+# The binary key is invisible, so SELECT * and every injected query still
+# see the five columns below, with the same text ids.
+USER_ID_COLUMNS = {
+    "uuid": "id CHAR(36) PRIMARY KEY DEFAULT (UUID()),",
+    "binary": """id CHAR(36) AS (BIN_TO_UUID(uid, 1)) VIRTUAL,
+            uid BINARY(16) NOT NULL DEFAULT (UUID_TO_BIN(UUID(), 1)) INVISIBLE PRIMARY KEY,""",
+}
 
 
 def create_tables(
@@ -26,15 +827,18 @@ def create_tables(
         mysql.connector.pooling.PooledMySQLConnection
         | mysql.connector.abstracts.MySQLConnectionAbstract
     ),
+    id_layout=ID_LAYOUT,
 ):
+    if ENGINE == "sqlite":
+        return sqlite.create_tables(conn)
     cursor = conn.cursor()
     cursor.execute("DROP TABLE IF EXISTS users")
     cursor.execute("DROP TABLE IF EXISTS blogs")
     cursor.execute("DROP TABLE IF EXISTS flag")
     cursor.execute(
-        """
+        f"""
         CREATE TABLE IF NOT EXISTS users (
-            id CHAR(36) PRIMARY KEY DEFAULT (UUID()),
+            {USER_ID_COLUMNS[id_layout]}
             username VARCHAR(20) NOT NULL UNIQUE,
             password VARCHAR(50) NOT NULL,
             role VARCHAR(20) DEFAULT 'user',
@@ -63,128 +867,57 @@ def create_tables(
     )
 
 
+def copy_rows(cursor, source, target, table):
+    # Generated columns cannot be written and invisible ones are left out of
+    # SELECT *, so copies name the stored columns.
+    cursor.execute(
+        "SELECT column_name FROM information_schema.columns"
+        " WHERE table_schema = %s AND table_name = %s AND generation_expression = ''"
+        " ORDER BY ordinal_position",
+        (source, table),
+    )
+    columns = ", ".join(f"`{name}`" for (name,) in cursor.fetchall())
+    cursor.execute(
+        f"INSERT INTO `{target}`.`{table}` ({columns}) "
+        f"SELECT {columns} FROM `{source}`.`{table}`"
+    )
+
+
 def init_data(
     conn: (
         mysql.connector.pooling.PooledMySQLConnection
         | mysql.connector.abstracts.MySQLConnectionAbstract
     ),
 ):
+    users = [(username, os.urandom(12).hex(), role) for username, role in USERS_DATA]
+    if ENGINE == "sqlite":
+        return sqlite.init_data(conn, users, BLOGS_DATA, secrets.get("flag_2"))
 
     cursor = conn.cursor()
 
-    users_data = [
-        ("alice", f"{os.urandom(12).hex()}", "user"),
-        ("bob", f"{os.urandom(12).hex()}", "user"),
-        ("charlie", f"{os.urandom(12).hex()}", "user"),
-        ("diana", f"{os.urandom(12).hex()}", "user"),
-        ("edward", f"{os.urandom(12).hex()}", "user"),
-        ("fiona", f"{os.urandom(12).hex()}", "user"),
-        ("george", f"{os.urandom(12).hex()}", "user"),
-        ("helen", f"{os.urandom(12).hex()}", "user"),
-        ("ivan", f"{os.urandom(12).hex()}", "user"),
-        ("julia", f"{os.urandom(12).hex()}", "user"),
-        ("kevin", f"{os.urandom(12).hex()}", "user"),
-        ("admin", f"{os.urandom(12).hex()}", "admin"),
-        ("linda", f"{os.urandom(12).hex()}", "user"),
-        ("martin", f"{os.urandom(12).hex()}", "user"),
-        ("nancy", f"{os.urandom(12).hex()}", "user"),
-        ("oscar", f"{os.urandom(12).hex()}", "user"),
-        ("penny", f"{os.urandom(12).hex()}", "user"),
-        ("quincy", f"{os.urandom(12).hex()}", "user"),
-        ("rachel", f"{os.urandom(12).hex()}", "user"),
-        ("steve", f"{os.urandom(12).hex()}", "user"),
-        ("tina", f"{os.urandom(12).hex()}", "user"),
-        ("victor", f"{os.urandom(12).hex()}", "user"),
-        ("wendy", f"{os.urandom(12).hex()}", "user"),
-        ("xavier", f"{os.urandom(12).hex()}", "user"),
-        ("yvonne", f"{os.urandom(12).hex()}", "user"),
-        ("zack", f"{os.urandom(12).hex()}", "user"),
-    ]
-
-    for username, password, role in users_data:
-        cursor.execute(
-            """
-            INSERT INTO users (username, password, role) VALUES
-                (%s, %s, %s);
-            """,
-            (username, password, role),
-        )
-
-    # Insert blogs with author_name matching usernames
-    blogs_data = [
-        ("Basic Python Programming", "alice"),
-        ("Introduction to Docker", "bob"),
-        ("Effective Git Usage Guide", "charlie"),
-        ("5 Python Libraries for Data Science", "diana"),
-        ("Getting Started with ReactJS", "edward"),
-        ("How to Optimize JavaScript Performance", "fiona"),
-        ("Machine Learning for Beginners", "george"),
-        ("REST API with Flask and Python", "helen"),
-        ("CSS Grid vs Flexbox: When to Use What?", "ivan"),
-        ("Web Security: Basic Things You Need to Know", "julia"),
-        ("Node.js and MongoDB: Building Fullstack Applications", "kevin"),
-        ("TypeScript: Why Should You Learn It?", "linda"),
-        ("Basic DevOps: CI/CD with GitHub Actions", "martin"),
-        ("Vue.js 3: Notable New Features", "nancy"),
-        ("SQL Injection and Prevention Methods", "oscar"),
-        ("Redis: Efficient Cache and Session Store", "penny"),
-        ("Design Patterns in OOP Programming", "quincy"),
-        ("Microservices vs Monolith: Which Architecture to Choose?", "rachel"),
-        ("Kubernetes Basics for Developers", "steve"),
-        ("Clean Code: Writing Clean and Maintainable Code", "tina"),
-        ("AWS Lambda: Practical Serverless Computing", "victor"),
-        ("GraphQL vs REST: Detailed Comparison", "wendy"),
-        ("Unit Testing with Jest and Python unittest", "xavier"),
-        ("Blockchain and Smart Contract Basics", "yvonne"),
-        ("Performance Testing with JMeter", "zack"),
-        ("Mobile App Development with React Native", "alice"),
-        ("Data Science with Pandas and NumPy", "bob"),
-        ("Elasticsearch: Data Search and Analysis", "charlie"),
-        ("OAuth 2.0 and JWT in Authentication", "diana"),
-        ("Agile and Scrum: Methodology for Effective Teams", "edward"),
-        ("Progressive Web Apps (PWA): The Future of Web", "fiona"),
-        ("Apache Kafka: Message Queue for Large Systems", "george"),
-        ("Code Review: Best Practices and Tools", "helen"),
-        ("Cyber Security: Protecting Web Applications", "ivan"),
-        ("Flutter vs React Native: Which Framework to Choose?", "julia"),
-        ("Big Data with Apache Spark", "kevin"),
-        ("Monitoring and Logging in Production", "linda"),
-        ("API Design: RESTful Best Practices", "martin"),
-        ("Git Advanced: Rebase, Cherry-pick and Hooks", "nancy"),
-        ("Load Balancing and High Availability", "oscar"),
-        ("Containerization with Docker and Kubernetes", "penny"),
-        ("Microservices Architecture Best Practices", "quincy"),
-        ("Web Security and Penetration Testing", "rachel"),
-        ("Cloud Computing with AWS and Azure", "steve"),
-        ("Database Optimization and Performance Tuning", "tina"),
-        ("Frontend Frameworks: React vs Vue vs Angular", "victor"),
-        ("Backend Development with Node.js and Express", "wendy"),
-        ("Data Analysis with Python and R", "xavier"),
-        ("Mobile Development: Native vs Cross-platform", "yvonne"),
-        ("DevSecOps: Security in CI/CD Pipeline", "zack"),
-    ]
+    cursor.executemany(
+        "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
+        users,
+    )
 
-    for title, author_name in blogs_data:
-        cursor.execute(
-            """
-            INSERT INTO blogs (title, author_name) VALUES (%s, %s);
-            """,
-            (title, author_name),
-        )
+    cursor.executemany(
+        "INSERT INTO blogs (title, author_name) VALUES (%s, %s)",
+        BLOGS_DATA,
+    )
 
     cursor.execute(
         """
         INSERT INTO flag (flag) VALUES
             (%s);
         """,
-        (FLAG_2,),
+        (secrets.get("flag_2"),),
     )
 
 
-def main():
-    conn = get_db_connection()
+def main(backend=None):
+    conn = wait_for_database(backend=backend)
     create_tables(conn)
     init_data(conn)
     conn.commit()
     conn.close()
-    print("Database initialized successfully!")
+    print(f"Database on {backend or BACKENDS[0]} initialized successfully!")
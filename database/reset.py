@@ -0,0 +1,314 @@
+import os, sys, json, time, argparse, threading
+import mysql.connector
+import database.db as db
+import database.search as search
+import database.tenants as tenants
+import lab.reqlog as reqlog
+
+SNAPSHOT_SCHEMA = "sqli_lab_snapshot"
+# A ready-made copy of the snapshot that a reset swaps in with one RENAME
+# TABLE, so the reset costs the same no matter how many rows were seeded.
+SPARE_SCHEMA = "sqli_lab_spare"
+TRASH_SCHEMA = "sqli_lab_trash"
+TABLES = tenants.TABLES
+
+RESET_LOCK = "sqli_lab_reset"
+SPARE_LOCK = "sqli_lab_spare"
+LOCK_TIMEOUT = 10
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+def copy_tables(cursor, source, target, tables=TABLES):
+    search.disable_stopwords(cursor)
+    for table in tables:
+        cursor.execute(f"DROP TABLE IF EXISTS `{target}`.`{table}`")
+        cursor.execute(f"CREATE TABLE `{target}`.`{table}` LIKE `{source}`.`{table}`")
+        db.copy_rows(cursor, source, target, table)
+
+
+def list_tables(cursor, schema):
+    cursor.execute(
+        "SELECT table_name FROM information_schema.tables "
+        "WHERE table_schema = %s AND table_type = 'BASE TABLE'",
+        (schema,),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def lab_schemas(cursor, table):
+    # The live schema, every copy a reset or a new tenant starts from, and
+    # the tenants, when they hold the table.
+    cursor.execute(
+        "SELECT table_schema FROM information_schema.tables"
+        " WHERE table_name = %s AND table_type = 'BASE TABLE'"
+        " AND (table_schema IN (%s, %s, %s, %s) OR table_schema LIKE %s)"
+        " ORDER BY table_schema",
+        (
+            table,
+            db.DB_CONFIG["database"],
+            SNAPSHOT_SCHEMA,
+            SPARE_SCHEMA,
+            tenants.TEMPLATE_SCHEMA,
+            tenants.TENANT_PREFIX.replace("_", "\\_") + "%",
+        ),
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def plugin_files(cursor, backend):
+    cursor.execute("SELECT @@plugin_dir")
+    plugin_dir = cursor.fetchone()[0]
+    if db.backend_config(backend)["host"] not in LOCAL_HOSTS:
+        return plugin_dir, None
+    try:
+        return plugin_dir, set(os.listdir(plugin_dir))
+    except OSError:
+        # mysqld runs on another host or the directory is not readable.
+        return plugin_dir, None
+
+
+def snapshot(database=None, backend=None):
+    backend = backend or db.BACKENDS[0]
+    database = database or db.DB_CONFIG["database"]
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{SNAPSHOT_SCHEMA}`")
+        copy_tables(cursor, database, SNAPSHOT_SCHEMA)
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS `{SNAPSHOT_SCHEMA}`.manifest (
+                kind VARCHAR(16) NOT NULL,
+                name VARCHAR(255) NOT NULL,
+                PRIMARY KEY (kind, name)
+            );
+            """
+        )
+        # Functions and plugin files are only recorded the first time, so a
+        # restart after students dropped files there does not bless them.
+        cursor.execute(f"SELECT COUNT(*) FROM `{SNAPSHOT_SCHEMA}`.manifest")
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(
+                f"INSERT INTO `{SNAPSHOT_SCHEMA}`.manifest (kind, name) "
+                "SELECT 'function', name FROM mysql.func"
+            )
+            _, files = plugin_files(cursor, backend)
+            if files is not None:
+                cursor.executemany(
+                    f"INSERT INTO `{SNAPSHOT_SCHEMA}`.manifest (kind, name) VALUES ('file', %s)",
+                    [(name,) for name in sorted(files)],
+                )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    prepare_spare(backend)
+    print(f"Lab snapshot on {backend} taken successfully!")
+
+
+def prepare_spare(backend=None):
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (SPARE_LOCK,))
+        if cursor.fetchone()[0] != 1:
+            # Another process is already rebuilding it.
+            return
+        try:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{SPARE_SCHEMA}`")
+            cursor.execute(f"CREATE DATABASE `{SPARE_SCHEMA}`")
+            copy_tables(cursor, SNAPSHOT_SCHEMA, SPARE_SCHEMA)
+            # Written last: a spare without it is still being copied.
+            cursor.execute(f"CREATE TABLE `{SPARE_SCHEMA}`.ready (id INT)")
+            conn.commit()
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (SPARE_LOCK,))
+            cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _prepare_spare_in_background(backend):
+    try:
+        prepare_spare(backend)
+    except Exception as e:
+        print(f"Preparing the reset spare failed: {str(e)}")
+
+
+def drop_objects(cursor, schema):
+    # Triggers cannot follow their table into another schema and routines or
+    # views left behind would survive the swap.
+    cursor.execute(
+        "SELECT trigger_name FROM information_schema.triggers WHERE trigger_schema = %s",
+        (schema,),
+    )
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"DROP TRIGGER IF EXISTS `{schema}`.`{name}`")
+    cursor.execute(
+        "SELECT routine_type, routine_name FROM information_schema.routines "
+        "WHERE routine_schema = %s",
+        (schema,),
+    )
+    for kind, name in cursor.fetchall():
+        cursor.execute(f"DROP {kind} IF EXISTS `{schema}`.`{name}`")
+    cursor.execute(
+        "SELECT table_name FROM information_schema.views WHERE table_schema = %s",
+        (schema,),
+    )
+    for (name,) in cursor.fetchall():
+        cursor.execute(f"DROP VIEW IF EXISTS `{schema}`.`{name}`")
+
+
+def swap_in_spare(cursor, schema):
+    if set(list_tables(cursor, SPARE_SCHEMA)) != {*TABLES, "ready"}:
+        return False
+    cursor.execute(f"DROP TABLE `{SPARE_SCHEMA}`.ready")
+    cursor.execute(f"DROP DATABASE IF EXISTS `{TRASH_SCHEMA}`")
+    cursor.execute(f"CREATE DATABASE `{TRASH_SCHEMA}`")
+    renames = [
+        f"`{schema}`.`{table}` TO `{TRASH_SCHEMA}`.`{table}`"
+        for table in list_tables(cursor, schema)
+    ]
+    renames += [
+        f"`{SPARE_SCHEMA}`.`{table}` TO `{schema}`.`{table}`" for table in TABLES
+    ]
+    # One statement, so queries see either the old tables or the new ones.
+    cursor.execute("RENAME TABLE " + ", ".join(renames))
+    cursor.execute(f"DROP DATABASE `{TRASH_SCHEMA}`")
+    return True
+
+
+def drop_functions(cursor):
+    cursor.execute(
+        f"SELECT name FROM mysql.func WHERE name NOT IN "
+        f"(SELECT name FROM `{SNAPSHOT_SCHEMA}`.manifest WHERE kind = 'function')"
+    )
+    names = [row[0] for row in cursor.fetchall()]
+    for name in names:
+        cursor.execute(f"DROP FUNCTION IF EXISTS `{name}`")
+    return names
+
+
+def clean_plugin_dir(cursor, backend):
+    cursor.execute(f"SELECT name FROM `{SNAPSHOT_SCHEMA}`.manifest WHERE kind = 'file'")
+    known = {row[0] for row in cursor.fetchall()}
+    plugin_dir, files = plugin_files(cursor, backend)
+    if not known or files is None:
+        return []
+    removed = []
+    for name in sorted(files - known):
+        path = os.path.join(plugin_dir, name)
+        if not os.path.isfile(path) or os.path.islink(path):
+            continue
+        try:
+            os.remove(path)
+            removed.append(name)
+        except OSError as e:
+            print(f"Failed to remove {path}: {str(e)}")
+    return removed
+
+
+def reset(team=None, background=True):
+    if db.ENGINE == "sqlite":
+        return [reset_embedded()]
+    # A team's schema lives on one backend; the shared one on all of them.
+    if team is not None:
+        return [reset_backend(team, background, backend=db.backend_for(team))]
+    return list(db.for_each_backend(reset_backend, None, background).values())
+
+
+def reset_embedded():
+    # Queries cannot write to the embedded database, so there is nothing to
+    # undo but fresh passwords; the tables are simply rebuilt.
+    start = time.perf_counter()
+    db.main()
+    result = {
+        "backend": "sqlite",
+        "schema": "main",
+        "method": "rebuild",
+        "seconds": round(time.perf_counter() - start, 6),
+        "dropped_functions": [],
+        "removed_files": [],
+    }
+    reqlog.record(type="reset", **result)
+    return result
+
+
+def reset_backend(team=None, background=True, backend=None):
+    backend = backend or db.BACKENDS[0]
+    start = time.perf_counter()
+    if team is not None and db.TENANT_MODE:
+        schema = tenants.schema_for(team)
+    else:
+        schema = db.DB_CONFIG["database"]
+
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (RESET_LOCK, LOCK_TIMEOUT))
+        if cursor.fetchone()[0] != 1:
+            raise mysql.connector.errors.OperationalError(
+                "Timed out waiting for another reset"
+            )
+        try:
+            # Running SLEEP() payloads hold metadata locks on the tables.
+            cursor.execute(f"SET SESSION lock_wait_timeout = {LOCK_TIMEOUT}")
+            drop_objects(cursor, schema)
+            if schema != db.DB_CONFIG["database"]:
+                tenants.clone(cursor, schema)
+                method = "clone"
+            elif swap_in_spare(cursor, schema):
+                method = "swap"
+            else:
+                for table in list_tables(cursor, schema):
+                    cursor.execute(f"DROP TABLE `{schema}`.`{table}`")
+                copy_tables(cursor, SNAPSHOT_SCHEMA, schema)
+                method = "copy"
+            functions = drop_functions(cursor)
+            files = clean_plugin_dir(cursor, backend)
+            conn.commit()
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (RESET_LOCK,))
+            cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    seconds = time.perf_counter() - start
+
+    if method != "clone":
+        if background:
+            threading.Thread(
+                target=_prepare_spare_in_background, args=(backend,), daemon=True
+            ).start()
+        else:
+            prepare_spare(backend)
+
+    result = {
+        "backend": backend,
+        "schema": schema,
+        "method": method,
+        "seconds": round(seconds, 6),
+        "dropped_functions": functions,
+        "removed_files": files,
+    }
+    reqlog.record(type="reset", **result)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Restore the lab database from its snapshot"
+    )
+    parser.add_argument("--team", help="reset only this team's schema in tenant mode")
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="take a new snapshot of the current lab database instead",
+    )
+    args = parser.parse_args()
+
+    if args.snapshot:
+        db.for_each_backend(snapshot)
+        sys.exit(0)
+    print(json.dumps(reset(args.team, background=False), indent=2))
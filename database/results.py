@@ -0,0 +1,80 @@
+import os
+
+MAX_ROWS = int(os.environ.get("LAB_MAX_ROWS", "1000"))
+MAX_BYTES = int(os.environ.get("LAB_MAX_BYTES", str(1024 * 1024)))
+
+# Leftover rows of an abandoned result are read and dropped up to this many;
+# past that the connection is thrown away instead of draining a huge result.
+DRAIN_ROWS = 1000
+
+
+def row_size(row):
+    values = row.values() if isinstance(row, dict) else row
+    return sum(len(str(value)) for value in values)
+
+
+def close(conn, cursor):
+    try:
+        drained = 0
+        while conn.unread_result and drained < DRAIN_ROWS:
+            if cursor.fetchone() is None:
+                break
+            drained += 1
+        if conn.unread_result:
+            conn.discard()
+            return
+        cursor.close()
+    except Exception:
+        conn.discard()
+        return
+    conn.close()
+
+
+class RowStream:
+    def __init__(
+        self,
+        conn,
+        cursor,
+        max_rows=MAX_ROWS,
+        max_bytes=MAX_BYTES,
+        error_message=lambda e: f"Database error: {str(e)}",
+    ):
+        self.conn = conn
+        self.cursor = cursor
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.error_message = error_message
+        self.count = 0
+        self.bytes = 0
+        self.truncated = False
+        self.error = None
+        self.closed = False
+        # Reading the first row up front surfaces query errors while the
+        # caller can still report them, before any output has been sent.
+        self.first = cursor.fetchone()
+
+    def __bool__(self):
+        return self.first is not None
+
+    def __iter__(self):
+        row = self.first
+        self.first = None
+        try:
+            while row is not None:
+                size = row_size(row)
+                if self.count >= self.max_rows or self.bytes + size > self.max_bytes:
+                    self.truncated = True
+                    break
+                self.count += 1
+                self.bytes += size
+                yield row
+                row = self.cursor.fetchone()
+        except Exception as e:
+            self.error = self.error_message(e)
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            close(self.conn, self.cursor)
@@ -0,0 +1,93 @@
+import os, re, argparse
+import database.db as db
+
+# An ngram FULLTEXT index on blogs.title lets the blog searches skip the
+# full scan a leading-wildcard LIKE needs on large tables.
+ENABLED = os.environ.get("LAB_SEARCH_INDEX", "0") == "1" and db.ENGINE == "mysql"
+INDEX_NAME = "blogs_title_ngram"
+# The server's ngram_token_size; shorter words produce no tokens to match.
+TOKEN_SIZE = 2
+
+# Only plain words go through the index. Quotes, LIKE wildcards and anything
+# else fall back to the statement the routes always ran, so every payload
+# still lands in the same query.
+INDEXABLE = re.compile(r"^[A-Za-z0-9]+( [A-Za-z0-9]+)*$")
+
+
+def indexable(search):
+    return (
+        ENABLED
+        and INDEXABLE.match(search) is not None
+        and max(map(len, search.split())) >= TOKEN_SIZE
+    )
+
+
+def title_filter(search):
+    """WHERE clause of the blog searches, with the search pasted in as before."""
+    if indexable(search):
+        # The MATCH narrows the candidates through the index; the LIKE keeps
+        # exactly the rows the plain search would return.
+        return (
+            f"MATCH(title) AGAINST ('\"{search}\"' IN BOOLEAN MODE)"
+            f" AND title LIKE '%{search}%'"
+        )
+    return f"title LIKE '%{search}%'"
+
+
+def has_index(cursor):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.statistics"
+        " WHERE table_schema = DATABASE() AND table_name = 'blogs'"
+        " AND index_name = %s",
+        (INDEX_NAME,),
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def disable_stopwords(cursor):
+    # With stopwords on, ngrams containing one ("a", "in", ...) are left out
+    # of an index and the MATCH would miss titles the LIKE finds. The setting
+    # is read whenever an index is built, including by CREATE TABLE ... LIKE
+    # and table rebuilds, so every session copying blogs needs it.
+    cursor.execute("SET SESSION innodb_ft_enable_stopword = OFF")
+
+
+def create_index(cursor):
+    if has_index(cursor):
+        return False
+    disable_stopwords(cursor)
+    cursor.execute(
+        f"ALTER TABLE blogs ADD FULLTEXT INDEX {INDEX_NAME} (title) WITH PARSER ngram"
+    )
+    return True
+
+
+def drop_index(cursor):
+    if not has_index(cursor):
+        return False
+    cursor.execute(f"ALTER TABLE blogs DROP INDEX {INDEX_NAME}")
+    return True
+
+
+def main(backend=None, drop=False):
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    try:
+        changed = drop_index(cursor) if drop else create_index(cursor)
+    finally:
+        cursor.close()
+        conn.close()
+    state = "dropped" if drop else "ready"
+    print(
+        f"[INFO] Search index on {backend or db.BACKENDS[0]} {state}"
+        f"{'' if changed else ' (unchanged)'}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Build the FULLTEXT index the indexed blog search uses"
+    )
+    parser.add_argument("--drop", action="store_true", help="remove the index instead")
+    args = parser.parse_args()
+    db.for_each_backend(main, drop=args.drop)
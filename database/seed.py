@@ -0,0 +1,273 @@
+import os, sys, time, random, argparse, tempfile
+import mysql.connector
+import database.db as db
+
+SEED_USERS = int(os.environ.get("LAB_SEED_USERS", "0"))
+SEED_BLOGS = int(os.environ.get("LAB_SEED_BLOGS", "0"))
+SEED = int(os.environ.get("LAB_SEED", "1303"))
+BATCH_SIZE = 5000
+INFILE_CHUNK = 1_000_000
+PROGRESS_INTERVAL = 2.0
+
+ADJECTIVES = [
+    "Practical",
+    "Advanced",
+    "Modern",
+    "Hands-on",
+    "Scalable",
+    "Secure",
+    "Effective",
+    "Minimal",
+    "Reliable",
+    "Distributed",
+    "Async",
+    "Hidden",
+]
+TOPICS = [
+    "Python",
+    "Docker",
+    "Git",
+    "ReactJS",
+    "JavaScript",
+    "Flask",
+    "CSS Grid",
+    "Node.js",
+    "TypeScript",
+    "Kubernetes",
+    "Redis",
+    "GraphQL",
+    "MySQL",
+    "Kafka",
+    "Spark",
+    "Terraform",
+    "Rust",
+    "Go",
+    "Linux",
+    "Nginx",
+]
+SUBJECTS = [
+    "Testing",
+    "Caching",
+    "Deployment",
+    "Monitoring",
+    "Security",
+    "Indexing",
+    "Logging",
+    "Debugging",
+    "Profiling",
+    "Refactoring",
+    "Packaging",
+    "Routing",
+]
+SUFFIXES = [
+    "for Beginners",
+    "in Production",
+    "Best Practices",
+    "Step by Step",
+    "Explained",
+    "Pitfalls",
+    "Cheat Sheet",
+    "Deep Dive",
+    "Under Load",
+]
+
+
+def user_rows(count, seed):
+    rng = random.Random(f"{seed}:users")
+    for n in range(count):
+        yield (f"user{n:07d}", f"{rng.getrandbits(96):024x}", "user")
+
+
+def blog_rows(count, seed, authors, chunk=10000):
+    rng = random.Random(f"{seed}:blogs")
+    choices = rng.choices
+    for offset in range(0, count, chunk):
+        k = min(chunk, count - offset)
+        for adjective, topic, subject, suffix, author in zip(
+            choices(ADJECTIVES, k=k),
+            choices(TOPICS, k=k),
+            choices(SUBJECTS, k=k),
+            choices(SUFFIXES, k=k),
+            choices(authors, k=k),
+        ):
+            yield (f"{adjective} {topic} {subject} {suffix}", author)
+
+
+class Progress:
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.start = time.monotonic()
+        self.last = self.start
+
+    def advance(self, rows):
+        self.done += rows
+        now = time.monotonic()
+        if now - self.last >= PROGRESS_INTERVAL:
+            self.last = now
+            print(
+                f"[SEED] {self.label}: {self.done:,}/{self.total:,} rows "
+                f"({self.done / (now - self.start):,.0f} rows/s)"
+            )
+
+    def finish(self):
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        print(
+            f"[SEED] {self.label}: {self.done:,} rows in {elapsed:.1f}s "
+            f"({self.done / elapsed:,.0f} rows/s)"
+        )
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def insert_rows(conn, sql, rows, progress, batch_size=BATCH_SIZE):
+    cursor = conn.cursor()
+    for batch in batched(rows, batch_size):
+        # executemany() rewrites a plain INSERT ... VALUES into one multi-row
+        # statement per batch.
+        cursor.executemany(sql, batch)
+        conn.commit()
+        progress.advance(len(batch))
+    cursor.close()
+    progress.finish()
+
+
+def escape_field(value):
+    return (
+        value.replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def load_rows(conn, table, columns, rows, progress, chunk_size=INFILE_CHUNK):
+    cursor = conn.cursor()
+    for chunk in batched(rows, chunk_size):
+        with tempfile.NamedTemporaryFile("w", suffix=".tsv", encoding="utf-8") as f:
+            f.writelines(
+                "\t".join(escape_field(value) for value in row) + "\n" for row in chunk
+            )
+            f.flush()
+            cursor.execute(
+                f"LOAD DATA LOCAL INFILE '{f.name}' INTO TABLE {table} "
+                f"CHARACTER SET utf8mb4 ({', '.join(columns)})"
+            )
+        conn.commit()
+        progress.advance(len(chunk))
+    cursor.close()
+    progress.finish()
+
+
+def seed_data(
+    users=SEED_USERS,
+    blogs=SEED_BLOGS,
+    seed=SEED,
+    method="insert",
+    database=None,
+    backend=None,
+):
+    config = db.backend_config(backend or db.BACKENDS[0])
+    if database:
+        config["database"] = database
+    if method == "infile":
+        config["allow_local_infile"] = True
+        config["allow_local_infile_in_path"] = tempfile.gettempdir()
+
+    conn = mysql.connector.connect(**config)
+    cursor = conn.cursor()
+    cursor.execute("SET unique_checks = 0, foreign_key_checks = 0")
+
+    local_infile = None
+    if method == "infile":
+        cursor.execute("SELECT @@GLOBAL.local_infile")
+        local_infile = cursor.fetchone()[0]
+        cursor.execute("SET GLOBAL local_infile = 1")
+
+    start = time.monotonic()
+    try:
+        authors = [username for username, _ in db.USERS_DATA]
+        if users:
+            rows = user_rows(users, seed)
+            progress = Progress("users", users)
+            if method == "infile":
+                load_rows(
+                    conn, "users", ("username", "password", "role"), rows, progress
+                )
+            else:
+                insert_rows(
+                    conn,
+                    "INSERT INTO users (username, password, role) VALUES (%s, %s, %s)",
+                    rows,
+                    progress,
+                )
+            authors += [
+                username for username, _, _ in user_rows(min(users, 10000), seed)
+            ]
+
+        if blogs:
+            rows = blog_rows(blogs, seed, authors)
+            progress = Progress("blogs", blogs)
+            if method == "infile":
+                load_rows(conn, "blogs", ("title", "author_name"), rows, progress)
+            else:
+                insert_rows(
+                    conn,
+                    "INSERT INTO blogs (title, author_name) VALUES (%s, %s)",
+                    rows,
+                    progress,
+                )
+    finally:
+        if local_infile is not None:
+            cursor.execute(f"SET GLOBAL local_infile = {int(local_infile)}")
+        cursor.close()
+        conn.close()
+
+    total = users + blogs
+    elapsed = max(time.monotonic() - start, 1e-9)
+    print(
+        f"[SEED] Seeded {total:,} synthetic rows on {config['host']}:{config['port']} in {elapsed:.1f}s "
+        f"({total / elapsed:,.0f} rows/s)"
+    )
+
+
+def main(backend=None):
+    if SEED_USERS or SEED_BLOGS:
+        seed_data(backend=backend)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Append deterministic synthetic users and blogs to the lab database"
+    )
+    parser.add_argument("--users", type=int, default=SEED_USERS)
+    parser.add_argument("--blogs", type=int, default=SEED_BLOGS)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--method", choices=("insert", "infile"), default="insert")
+    parser.add_argument("--database", default=None)
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="recreate the tables with the hand-written rows before seeding",
+    )
+    args = parser.parse_args()
+
+    if not args.users and not args.blogs:
+        parser.print_help()
+        sys.exit(1)
+    if args.reset:
+        db.for_each_backend(db.main)
+    # Every backend gets the same rows, loaded in parallel.
+    db.for_each_backend(
+        seed_data, args.users, args.blogs, args.seed, args.method, args.database
+    )
@@ -0,0 +1,82 @@
+import os, time, threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+import database.db as db
+import database.results as results
+import lab.pagecache as pagecache
+
+WORKERS = int(os.environ.get("LAB_TIME_WORKERS", str(db.SLOW_POOL_SIZE)))
+QUEUE_SIZE = int(os.environ.get("LAB_TIME_QUEUE", str(WORKERS * 2)))
+POLL_INTERVAL = 0.25
+
+
+class Busy(Exception):
+    pass
+
+
+class ClientGone(Exception):
+    pass
+
+
+class SlowQuery:
+    def __init__(self, database, sql, backend=None):
+        self.database = database
+        self.sql = sql
+        self.backend = backend
+        self.connection_id = None
+        self.lock = threading.Lock()
+
+    def run(self):
+        conn = db.get_db_connection(self.database, pool="slow", backend=self.backend)
+        cursor = conn.cursor(dictionary=True)
+        try:
+            with self.lock:
+                self.connection_id = conn.connection_id
+            start = time.perf_counter()
+            cursor.execute(self.sql)
+            row = cursor.fetchone()
+            return row is not None, time.perf_counter() - start
+        finally:
+            with self.lock:
+                self.connection_id = None
+            results.close(conn, cursor)
+
+    def kill(self):
+        # Holding the lock keeps the id from being released back to the pool
+        # and reused by someone else's query while KILL QUERY is in flight.
+        with self.lock:
+            if self.connection_id is None:
+                return
+            conn = db.get_db_connection(backend=self.backend)
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"KILL QUERY {int(self.connection_id)}")
+            finally:
+                results.close(conn, cursor)
+
+
+_executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="sqli-time")
+_slots = threading.BoundedSemaphore(WORKERS + QUEUE_SIZE)
+
+
+def run(database, sql, client_gone=None, backend=None):
+    if not _slots.acquire(blocking=False):
+        raise Busy("Too many time-based queries in progress")
+
+    # The connection is checked out on an executor thread, outside the
+    # request context that would mark the page as uncacheable.
+    pagecache.uncacheable()
+    query = SlowQuery(database, sql, backend)
+    try:
+        future = _executor.submit(query.run)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+
+    while True:
+        try:
+            return future.result(timeout=POLL_INTERVAL)
+        except TimeoutError:
+            if client_gone is not None and client_gone():
+                query.kill()
+                raise ClientGone("Client disconnected")
@@ -0,0 +1,129 @@
+import os, time, sqlite3, threading
+
+# The lab tables in an in-memory database shared by the threads of this
+# process; set a file path to keep them on disk instead.
+PATH = os.environ.get("LAB_SQLITE_PATH", "file:sqli_lab?mode=memory&cache=shared")
+# There is no KILL QUERY; runaway payloads such as endless recursive CTEs
+# are interrupted after this long.
+QUERY_TIMEOUT_MS = int(os.environ.get("LAB_SQLITE_QUERY_TIMEOUT_MS", "2000"))
+PROGRESS_STEPS = 10000
+# randomblob(1000000000) would otherwise allocate a gigabyte in one step.
+MAX_LENGTH = 1024 * 1024
+
+# Random version 4 ids in the same 36-character form as MySQL's UUID().
+UUID = (
+    "lower(hex(randomblob(4))) || '-' || lower(hex(randomblob(2))) || '-4' ||"
+    " substr(lower(hex(randomblob(2))), 2) || '-' ||"
+    " substr('89ab', 1 + abs(random()) % 4, 1) ||"
+    " substr(lower(hex(randomblob(2))), 2) || '-' || lower(hex(randomblob(6)))"
+)
+
+# An in-memory database only lives while a connection to it is open.
+_keeper = None
+_keeper_lock = threading.Lock()
+
+
+def dict_row(cursor, row):
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
+
+class Connection:
+    """The part of a pooled MySQL connection the lab uses, over sqlite3."""
+
+    # Results are never held by the server, so a connection can always go
+    # back without draining its cursors.
+    unread_result = False
+    connection_id = None
+
+    def __init__(self, cnx):
+        self._cnx = cnx
+
+    def cursor(self, dictionary=False, **kwargs):
+        cursor = self._cnx.cursor()
+        if dictionary:
+            cursor.row_factory = dict_row
+        return cursor
+
+    def commit(self):
+        self._cnx.commit()
+
+    def rollback(self):
+        self._cnx.rollback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._cnx.close()
+
+    discard = close
+
+
+def connect(writable=False):
+    global _keeper
+    if _keeper is None:
+        with _keeper_lock:
+            if _keeper is None:
+                _keeper = sqlite3.connect(PATH, uri=True, check_same_thread=False)
+    # Streamed pages can finish on another thread than the one that opened
+    # the connection; it is still only used by one request at a time.
+    cnx = sqlite3.connect(PATH, uri=True, check_same_thread=False)
+    if not writable:
+        # Injected queries can read anything but change nothing, so the
+        # data never needs a reset.
+        cnx.execute("PRAGMA query_only = ON")
+        cnx.setlimit(sqlite3.SQLITE_LIMIT_LENGTH, MAX_LENGTH)
+        deadline = time.monotonic() + QUERY_TIMEOUT_MS / 1000
+        cnx.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_STEPS)
+    return cnx
+
+
+def create_tables(conn):
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS users")
+    cursor.execute("DROP TABLE IF EXISTS blogs")
+    cursor.execute("DROP TABLE IF EXISTS flag")
+    # NOCASE matches the case-insensitive comparisons of MySQL's default
+    # collation, so the same payloads find the same rows.
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS users (
+            id CHAR(36) PRIMARY KEY DEFAULT ({UUID}),
+            username VARCHAR(20) NOT NULL UNIQUE COLLATE NOCASE,
+            password VARCHAR(50) NOT NULL,
+            role VARCHAR(20) DEFAULT 'user',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS blogs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title VARCHAR(200) NOT NULL COLLATE NOCASE,
+            author_name VARCHAR(50) COLLATE NOCASE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS flag (
+            flag TEXT NOT NULL
+        );
+        """
+    )
+
+
+def init_data(conn, users, blogs, flag):
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO users (username, password, role) VALUES (?, ?, ?)", users
+    )
+    cursor.executemany("INSERT INTO blogs (title, author_name) VALUES (?, ?)", blogs)
+    cursor.execute("INSERT INTO flag (flag) VALUES (?)", (flag,))
@@ -0,0 +1,212 @@
+import os, time, hashlib, threading
+from collections import OrderedDict
+import mysql.connector
+import database.db as db
+import database.search as search
+
+TEMPLATE_SCHEMA = "sqli_lab_template"
+CONTROL_SCHEMA = "sqli_lab_control"
+TENANT_PREFIX = "sqli_lab_t_"
+TABLES = ("users", "blogs", "flag")
+
+TENANT_TTL = int(os.environ.get("LAB_TENANT_TTL", "1800"))
+MAX_TENANTS = int(os.environ.get("LAB_MAX_TENANTS", "500"))
+TOUCH_INTERVAL = 30
+SWEEP_INTERVAL = 60
+
+# Schemas this process provisioned or touched recently, so a request only
+# pays a round trip to the control table once every TOUCH_INTERVAL seconds.
+_touched = OrderedDict()
+_lock = threading.Lock()
+_last_sweep = 0.0
+_sweeping = False
+
+
+def schema_for(team):
+    return TENANT_PREFIX + hashlib.sha1(team.encode()).hexdigest()[:16]
+
+
+def create_control_table(cursor):
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{CONTROL_SCHEMA}`")
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS `{CONTROL_SCHEMA}`.tenants (
+            schema_name VARCHAR(64) PRIMARY KEY,
+            team VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_used TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX (last_used)
+        );
+        """
+    )
+
+
+def drop_tenants(cursor):
+    cursor.execute(
+        "SELECT schema_name FROM information_schema.schemata WHERE schema_name LIKE %s",
+        (TENANT_PREFIX.replace("_", "\\_") + "%",),
+    )
+    for (schema,) in cursor.fetchall():
+        cursor.execute(f"DROP DATABASE IF EXISTS `{schema}`")
+    cursor.execute(f"DELETE FROM `{CONTROL_SCHEMA}`.tenants")
+
+
+def main(backend=None):
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{TEMPLATE_SCHEMA}`")
+    cursor.execute(f"CREATE DATABASE `{TEMPLATE_SCHEMA}`")
+    conn.cmd_init_db(TEMPLATE_SCHEMA)
+    db.create_tables(conn)
+    db.init_data(conn)
+    if search.ENABLED:
+        # Clones copy the index with the table.
+        search.create_index(cursor)
+    create_control_table(cursor)
+    # Tenants cloned from the previous template are stale now.
+    drop_tenants(cursor)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    with _lock:
+        _touched.clear()
+    print("Tenant template initialized successfully!")
+
+
+def clone(cursor, schema):
+    search.disable_stopwords(cursor)
+    cursor.execute(f"DROP DATABASE IF EXISTS `{schema}`")
+    cursor.execute(f"CREATE DATABASE `{schema}`")
+    for table in TABLES:
+        cursor.execute(
+            f"CREATE TABLE `{schema}`.`{table}` LIKE `{TEMPLATE_SCHEMA}`.`{table}`"
+        )
+        db.copy_rows(cursor, TEMPLATE_SCHEMA, schema, table)
+
+
+def provision(conn, cursor, schema, team):
+    # The named lock serialises workers racing to create the same tenant.
+    cursor.execute("SELECT GET_LOCK(%s, 10)", (schema,))
+    if cursor.fetchone()[0] != 1:
+        raise mysql.connector.errors.OperationalError(
+            f"Timed out waiting to provision {schema}"
+        )
+    try:
+        cursor.execute(
+            f"SELECT 1 FROM `{CONTROL_SCHEMA}`.tenants WHERE schema_name = %s",
+            (schema,),
+        )
+        if cursor.fetchall():
+            return
+        clone(cursor, schema)
+        cursor.execute(
+            f"INSERT INTO `{CONTROL_SCHEMA}`.tenants (schema_name, team) VALUES (%s, %s)",
+            (schema, team[:255]),
+        )
+        conn.commit()
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (schema,))
+        cursor.fetchall()
+
+
+def get_schema(team):
+    schema = schema_for(team)
+    now = time.monotonic()
+    with _lock:
+        last = _touched.get(schema)
+        if last is not None and now - last < TOUCH_INTERVAL:
+            _touched.move_to_end(schema)
+            return schema
+
+    conn = db.get_db_connection(backend=db.backend_for(team))
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"UPDATE `{CONTROL_SCHEMA}`.tenants SET last_used = NOW() WHERE schema_name = %s",
+            (schema,),
+        )
+        conn.commit()
+        if cursor.rowcount == 0:
+            provision(conn, cursor, schema, team)
+    finally:
+        cursor.close()
+        conn.close()
+
+    with _lock:
+        _touched[schema] = now
+        _touched.move_to_end(schema)
+        while len(_touched) > MAX_TENANTS:
+            _touched.popitem(last=False)
+
+    maybe_sweep()
+    return schema
+
+
+def maybe_sweep():
+    global _last_sweep, _sweeping
+    with _lock:
+        if _sweeping or time.monotonic() - _last_sweep < SWEEP_INTERVAL:
+            return
+        _sweeping = True
+        _last_sweep = time.monotonic()
+    threading.Thread(target=_sweep_in_background, daemon=True).start()
+
+
+def _sweep_in_background():
+    global _sweeping
+    try:
+        db.for_each_backend(sweep)
+    except Exception as e:
+        print(f"Tenant sweep failed: {str(e)}")
+    finally:
+        with _lock:
+            _sweeping = False
+
+
+def sweep(backend=None):
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT schema_name FROM `{CONTROL_SCHEMA}`.tenants WHERE last_used < NOW() - INTERVAL %s SECOND",
+            (TENANT_TTL,),
+        )
+        expired = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(f"SELECT COUNT(*) FROM `{CONTROL_SCHEMA}`.tenants")
+        overflow = cursor.fetchone()[0] - len(expired) - MAX_TENANTS
+        if overflow > 0:
+            # Least recently used first, but never a tenant another worker may
+            # still be serving from its touch cache.
+            cursor.execute(
+                f"""
+                SELECT schema_name FROM `{CONTROL_SCHEMA}`.tenants
+                WHERE last_used >= NOW() - INTERVAL %s SECOND
+                  AND last_used < NOW() - INTERVAL %s SECOND
+                ORDER BY last_used LIMIT %s
+                """,
+                (TENANT_TTL, TOUCH_INTERVAL * 2, overflow),
+            )
+            expired += [row[0] for row in cursor.fetchall()]
+
+        for schema in expired:
+            cursor.execute("SELECT GET_LOCK(%s, 0)", (schema,))
+            if cursor.fetchone()[0] != 1:
+                continue
+            try:
+                cursor.execute(f"DROP DATABASE IF EXISTS `{schema}`")
+                cursor.execute(
+                    f"DELETE FROM `{CONTROL_SCHEMA}`.tenants WHERE schema_name = %s",
+                    (schema,),
+                )
+                conn.commit()
+            finally:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (schema,))
+                cursor.fetchall()
+            with _lock:
+                _touched.pop(schema, None)
+        if expired:
+            print(f"Reclaimed {len(expired)} idle tenant schema(s)")
+    finally:
+        cursor.close()
+        conn.close()
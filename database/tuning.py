@@ -0,0 +1,234 @@
+import os, re, sys, math, argparse, configparser
+import database.db as db
+import database.aio as aio
+import database.tenants as tenants
+import lab.sandbox as sandbox
+
+BASE_CNF = os.path.join(
+    os.path.dirname(os.path.dirname(__file__)), "config", "mysql.cnf"
+)
+TEAMS = int(os.environ.get("LAB_TEAMS", "300"))
+
+MiB = 1024 * 1024
+GiB = 1024 * MiB
+# InnoDB rounds the buffer pool to chunk size x instances.
+CHUNK = 128 * MiB
+# Rough per-connection cost: thread stack plus the sort, join and read
+# buffers a lab query can allocate.
+CONNECTION_MEMORY = 2 * MiB
+WEB_PROCESS_MEMORY = 100 * MiB
+SANDBOX_MEMORY = 30 * MiB
+SYSTEM_MEMORY = 256 * MiB
+# Boot, reset, the tenant sweeper, KILL QUERY and someone with a mysql shell.
+SPARE_CONNECTIONS = 20
+TABLES_PER_SCHEMA = len(tenants.TABLES) + 2
+
+SIZE = re.compile(r"^(\d+)([KMG]?)$", re.I)
+
+
+def cgroup_value(*paths):
+    for path in paths:
+        try:
+            with open(path) as f:
+                return f.read().split()
+        except OSError:
+            continue
+    return None
+
+
+def host_cores():
+    cores = len(os.sched_getaffinity(0))
+    quota = cgroup_value("/sys/fs/cgroup/cpu.max")
+    if quota and quota[0] != "max":
+        cores = min(cores, math.ceil(int(quota[0]) / int(quota[1])))
+    return max(1, cores)
+
+
+def host_memory():
+    memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    limit = cgroup_value(
+        "/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"
+    )
+    if limit and limit[0].isdigit():
+        memory = min(memory, int(limit[0]))
+    return memory
+
+
+def app_connections(cores):
+    # Every web process keeps its own pools, one set per backend.
+    if os.environ.get("LAB_SERVER") == "asgi":
+        return 1, aio.POOL_SIZE + aio.SLOW_POOL_SIZE + db.POOL_SIZE
+    processes = int(os.environ.get("LAB_WORKERS", str(cores)))
+    return processes, processes * (db.POOL_SIZE + db.SLOW_POOL_SIZE)
+
+
+def profile(cores=None, memory=None, teams=TEAMS):
+    cores = cores or host_cores()
+    memory = memory or host_memory()
+    processes, pooled = app_connections(cores)
+    max_connections = max(151, math.ceil(pooled * 1.1) + SPARE_CONNECTIONS)
+
+    reserved = (
+        SYSTEM_MEMORY
+        + processes * (WEB_PROCESS_MEMORY + sandbox.WORKERS * SANDBOX_MEMORY)
+        + max_connections * CONNECTION_MEMORY
+    )
+    budget = max(CHUNK, int((memory - reserved) * 0.75))
+    instances = max(1, min(8, budget // GiB))
+    buffer_pool = max(1, budget // (CHUNK * instances)) * CHUNK * instances
+
+    # Snapshot, spare and template copies, plus a schema per active team.
+    schemas = 4 + (min(teams, tenants.MAX_TENANTS) if db.TENANT_MODE else 0)
+    table_open_cache = max(2000, max_connections * 4, schemas * TABLES_PER_SCHEMA * 2)
+
+    settings = {
+        "max_connections": max_connections,
+        "thread_cache_size": min(pooled + SPARE_CONNECTIONS, max_connections),
+        "innodb_buffer_pool_size": buffer_pool,
+        "innodb_buffer_pool_instances": instances,
+        "table_open_cache": table_open_cache,
+        "table_open_cache_instances": min(16, cores),
+        "table_definition_cache": 400 + schemas * TABLES_PER_SCHEMA,
+        "open_files_limit": table_open_cache * 2 + max_connections + 100,
+        # No max_execution_time: seeding, snapshot copies and other large
+        # SELECTs must not be cut off. The slow pools set it per session for
+        # the time-based challenge.
+        "innodb_lock_wait_timeout": 10,
+        "lock_wait_timeout": 60,
+        # Pooled connections are validated on checkout, so leaked ones can go.
+        "wait_timeout": 600,
+        "interactive_timeout": 600,
+    }
+    inputs = {
+        "cores": cores,
+        "memory": memory,
+        "teams": teams,
+        "processes": processes,
+        "pooled_connections": pooled,
+    }
+    return inputs, settings
+
+
+def option_name(name):
+    return name.replace("-", "_").lower()
+
+
+def read_base(path=BASE_CNF):
+    parser = configparser.ConfigParser(allow_no_value=True, strict=False)
+    parser.optionxform = str
+    parser.read(path)
+    return dict(parser["mysqld"]) if parser.has_section("mysqld") else {}
+
+
+def format_size(value):
+    for unit, size in (("G", GiB), ("M", MiB)):
+        if value % size == 0:
+            return f"{value // size}{unit}"
+    return str(value)
+
+
+def render(inputs, settings, base):
+    lines = [
+        "# Generated by `python3 -m database.tuning`; edit config/mysql.cnf to",
+        "# override a value or add options.",
+        f"# Host: {inputs['cores']} cores, {inputs['memory'] / GiB:.1f} GiB. "
+        f"Lab: {inputs['teams']} teams, {inputs['processes']} web processes, "
+        f"{inputs['pooled_connections']} pooled connections.",
+        "[mysqld]",
+    ]
+    # Hand-written options win, secure-file-priv above all.
+    overridden = {option_name(name) for name in base}
+    for name, value in base.items():
+        lines.append(name if value is None else f"{name}={value}")
+    for name, value in settings.items():
+        if name in overridden:
+            continue
+        if name.endswith("_size") and name != "thread_cache_size":
+            value = format_size(value)
+        lines.append(f"{name}={value}")
+    return "\n".join(lines) + "\n"
+
+
+def parse_value(value):
+    value = str(value).strip()
+    match = SIZE.match(value)
+    if match:
+        number, unit = match.groups()
+        return int(number) * {"": 1, "K": 1024, "M": MiB, "G": GiB}[unit.upper()]
+    return value.rstrip("/")
+
+
+def expected(settings, base):
+    wanted = dict(settings)
+    for name, value in base.items():
+        if value is not None:
+            wanted[option_name(name)] = value
+    return wanted
+
+
+def check(cursor, wanted):
+    """Compare the server's global variables with the profile; returns mismatches."""
+    # Options such as skip-name-resolve are not all variables, so look them
+    # up instead of selecting @@name.
+    cursor.execute(
+        "SELECT LOWER(VARIABLE_NAME), VARIABLE_VALUE FROM performance_schema.global_variables"
+        f" WHERE VARIABLE_NAME IN ({', '.join(['%s'] * len(wanted))})",
+        tuple(wanted),
+    )
+    live = dict(cursor.fetchall())
+    mismatches = []
+    for name in sorted(wanted):
+        if name in live and parse_value(live[name]) != parse_value(wanted[name]):
+            mismatches.append((name, live[name], wanted[name]))
+    return mismatches
+
+
+def check_backend(wanted, backend=None):
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    try:
+        return check(cursor, wanted)
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a mysql.cnf sized for this host and the lab settings"
+    )
+    parser.add_argument("--teams", type=int, default=TEAMS)
+    parser.add_argument("--cores", type=int, help="override the detected cores")
+    parser.add_argument("--memory-mb", type=int, help="override the detected memory")
+    parser.add_argument("--base", default=BASE_CNF)
+    parser.add_argument("--output", help="write the profile here instead of stdout")
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="compare the running servers' variables with the profile instead",
+    )
+    args = parser.parse_args()
+
+    memory = args.memory_mb * MiB if args.memory_mb else None
+    inputs, settings = profile(args.cores, memory, args.teams)
+    base = read_base(args.base)
+
+    if args.check:
+        wanted = expected(settings, base)
+        results = db.for_each_backend(check_backend, wanted)
+        drift = False
+        for backend, mismatches in results.items():
+            for name, live, value in mismatches:
+                drift = True
+                print(f"[WARN] {backend}: {name} is {live}, profile wants {value}")
+            if not mismatches:
+                print(f"[INFO] {backend}: all {len(wanted)} settings match the profile")
+        sys.exit(1 if drift else 0)
+
+    cnf = render(inputs, settings, base)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(cnf)
+        print(f"[INFO] Wrote MySQL profile to {args.output}")
+    else:
+        sys.stdout.write(cnf)
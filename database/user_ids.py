@@ -0,0 +1,96 @@
+import time, argparse
+import mysql.connector
+import database.db as db
+import database.reset as reset
+import database.search as search
+import database.version as version
+
+# In-place conversion between the users.id layouts of db.create_tables(),
+# for servers holding data that is slow to seed again. Ids keep their value:
+# UUID_TO_BIN(id, 1) and BIN_TO_UUID(uid, 1) are inverses.
+TO_BINARY = [
+    "ALTER TABLE {users} ADD COLUMN uid BINARY(16) NULL INVISIBLE",
+    "UPDATE {users} SET uid = UUID_TO_BIN(id, 1)",
+    "ALTER TABLE {users} DROP PRIMARY KEY, DROP COLUMN id,"
+    " MODIFY uid BINARY(16) NOT NULL DEFAULT (UUID_TO_BIN(UUID(), 1)) INVISIBLE,"
+    " ADD PRIMARY KEY (uid)",
+    "ALTER TABLE {users} ADD COLUMN id CHAR(36) AS (BIN_TO_UUID(uid, 1)) VIRTUAL FIRST",
+]
+TO_UUID = [
+    "ALTER TABLE {users} ADD COLUMN id_text CHAR(36) NULL FIRST",
+    "UPDATE {users} SET id_text = id",
+    "ALTER TABLE {users} DROP PRIMARY KEY, DROP COLUMN id, DROP COLUMN uid",
+    "ALTER TABLE {users} CHANGE id_text id CHAR(36) NOT NULL DEFAULT (UUID()) FIRST,"
+    " ADD PRIMARY KEY (id)",
+]
+
+
+def layout(cursor, schema):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.columns"
+        " WHERE table_schema = %s AND table_name = 'users' AND column_name = 'uid'",
+        (schema,),
+    )
+    return "binary" if cursor.fetchone()[0] else "uuid"
+
+
+def migrate(target, backend=None):
+    backend = backend or db.BACKENDS[0]
+    statements = TO_BINARY if target == "binary" else TO_UUID
+    converted = []
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    try:
+        # Resets copy these tables; keep them out until every copy matches.
+        cursor.execute(
+            "SELECT GET_LOCK(%s, %s)", (reset.RESET_LOCK, reset.LOCK_TIMEOUT)
+        )
+        if cursor.fetchone()[0] != 1:
+            raise mysql.connector.errors.OperationalError(
+                "Timed out waiting for a reset to finish"
+            )
+        try:
+            # The ALTERs rebuild the table and every index on it.
+            search.disable_stopwords(cursor)
+            for schema in reset.lab_schemas(cursor, "users"):
+                if layout(cursor, schema) == target:
+                    continue
+                start = time.perf_counter()
+                for statement in statements:
+                    cursor.execute(statement.format(users=f"`{schema}`.users"))
+                conn.commit()
+                converted.append(schema)
+                print(
+                    f"[INFO] {backend}: {schema}.users converted to {target} ids "
+                    f"in {time.perf_counter() - start:.1f}s"
+                )
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (reset.RESET_LOCK,))
+            cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.close()
+    return converted
+
+
+def record_layout(before, after, backend=None):
+    # Boot rebuilds the database when its version, which includes the id
+    # layout, differs; converted data should survive the next start.
+    if version.current(backend) == before:
+        version.record(after, backend)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Convert users.id between CHAR(36) and time-ordered BINARY(16)"
+    )
+    parser.add_argument("--to", choices=("binary", "uuid"), required=True)
+    args = parser.parse_args()
+
+    results = db.for_each_backend(migrate, args.to)
+    if not any(results.values()):
+        print(f"[INFO] Every users table already uses {args.to} ids")
+    before = version.expected()
+    db.ID_LAYOUT = args.to
+    db.for_each_backend(record_layout, before, version.expected())
+    print(f"[INFO] Set LAB_USER_ID_LAYOUT={args.to} for the next start")
@@ -0,0 +1,118 @@
+import os, json, hashlib
+import mysql.connector
+import database.db as db
+import database.seed as seed
+import database.search as search
+import database.tenants as tenants
+import database.reset as reset
+import lab.secrets as secrets
+
+# Bump whenever create_tables(), init_data() or the boot-time copies change
+# shape, so a baked data directory from an older image is rebuilt.
+SCHEMA_VERSION = 1
+
+
+def expected():
+    data = [
+        SCHEMA_VERSION,
+        db.USERS_DATA,
+        db.BLOGS_DATA,
+        seed.SEED_USERS,
+        seed.SEED_BLOGS,
+        seed.SEED,
+        db.TENANT_MODE,
+        search.ENABLED,
+        db.ID_LAYOUT,
+    ]
+    return hashlib.sha256(json.dumps(data).encode()).hexdigest()
+
+
+def create_table(cursor):
+    cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{tenants.CONTROL_SCHEMA}`")
+    cursor.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS `{tenants.CONTROL_SCHEMA}`.lab_version (
+            id TINYINT PRIMARY KEY,
+            version CHAR(64) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """
+    )
+
+
+def current(backend=None):
+    conn = db.wait_for_database(backend=backend)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"SELECT version FROM `{tenants.CONTROL_SCHEMA}`.lab_version WHERE id = 1"
+        )
+        row = cursor.fetchone()
+        return row[0] if row else None
+    except mysql.connector.errors.ProgrammingError:
+        # Fresh server: the control schema does not exist yet.
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def record(version, backend=None):
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    try:
+        create_table(cursor)
+        cursor.execute(
+            f"REPLACE INTO `{tenants.CONTROL_SCHEMA}`.lab_version (id, version) VALUES (1, %s)",
+            (version,),
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def refresh_secrets(backend=None):
+    # The data may come from a baked image: the flag is set to the shared
+    # one and the passwords get fresh values.
+    schemas = [db.DB_CONFIG["database"], reset.SNAPSHOT_SCHEMA, reset.SPARE_SCHEMA]
+    if db.TENANT_MODE:
+        schemas.append(tenants.TEMPLATE_SCHEMA)
+    passwords = [(os.urandom(12).hex(), username) for username, _ in db.USERS_DATA]
+
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    try:
+        for schema in schemas:
+            if not set(reset.TABLES) <= set(reset.list_tables(cursor, schema)):
+                # A spare that was still being copied; the next reset
+                # rebuilds it.
+                continue
+            cursor.execute(
+                f"UPDATE `{schema}`.flag SET flag = %s", (secrets.get("flag_2"),)
+            )
+            cursor.executemany(
+                f"UPDATE `{schema}`.users SET password = %s WHERE username = %s",
+                passwords,
+            )
+        if db.TENANT_MODE:
+            tenants.drop_tenants(cursor)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def update_flag(backend=None):
+    # After a rotation; running tenants get the new flag as well.
+    conn = db.get_db_connection(backend=backend)
+    cursor = conn.cursor()
+    try:
+        for schema in reset.lab_schemas(cursor, "flag"):
+            cursor.execute(
+                f"UPDATE `{schema}`.flag SET flag = %s", (secrets.get("flag_2"),)
+            )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
@@ -1,18 +1,39 @@
 #!/bin/bash
 
+export LAB_BOOT_STARTED=$(date +%s.%N)
+
+if [ "$LAB_DB_ENGINE" = "sqlite" ]; then
+    # Embedded database: no mysqld to configure, start or bake.
+    [ "$1" = "bake" ] && exit 0
+    echo "[INFO] Starting Python app with the embedded database..."
+    exec python3 serve.py
+fi
+
+phase_ms() {
+    echo $(( ($(date +%s%N) - ${1/./}) / 1000000 ))
+}
+
 echo "[INFO] Setting up MySQL configuration..."
-chmod 644 /app/config/mysql.cnf
-cp /app/config/mysql.cnf /etc/mysql/conf.d/
+# Sized for the cores and memory of this container, on top of the
+# hand-written options in config/mysql.cnf.
+if ! python3 -m database.tuning --output /etc/mysql/conf.d/mysql.cnf; then
+    echo "[WARN] Could not generate the tuned profile, using config/mysql.cnf as is"
+    cp /app/config/mysql.cnf /etc/mysql/conf.d/
+fi
+chmod 644 /etc/mysql/conf.d/mysql.cnf
 chown -R mysql:mysql /usr/lib/mysql/plugin/
 
 echo "[INFO] Starting MySQL service..."
 mysqld_safe --datadir=/var/lib/mysql &
 
 echo "[INFO] Waiting for MySQL to be ready..."
-until mysqladmin ping -h 127.0.0.1 --silent; do
-    echo "[INFO] MySQL is not ready yet, waiting..."
-    sleep 2
+# Poll the socket with a short, growing delay instead of a fixed sleep.
+delay=0.05
+until mysqladmin ping -h 127.0.0.1 --connect-timeout=1 --silent 2>/dev/null; do
+    sleep $delay
+    delay=$(awk -v d=$delay 'BEGIN { d *= 2; print (d > 1 ? 1 : d) }')
 done
+echo "[INFO] MySQL ready after $(phase_ms $LAB_BOOT_STARTED) ms"
 
 echo "[INFO] Setting up MySQL user and database..."
 if mysql -u root -e "SELECT 1;" >/dev/null 2>&1; then
@@ -27,5 +48,19 @@ else
 EOSQL
 fi
 
+if [ "$1" = "bake" ]; then
+    # Image build: initialize the data directory, then stop cleanly so the
+    # next start finds it ready.
+    echo "[INFO] Baking the lab database..."
+    python3 -c "import app; app.bootstrap(); app.secrets.forget()" || exit 1
+    mysqladmin -h 127.0.0.1 -u root -proot shutdown
+    wait
+    echo "[INFO] Baked the lab database in $(phase_ms $LAB_BOOT_STARTED) ms"
+    exit 0
+fi
+
 echo "[INFO] Starting Python app..."
-exec python3 app.py
\ No newline at end of file
+if [ "$LAB_SERVER" = "asgi" ]; then
+    exec python3 asgi.py
+fi
+exec python3 serve.py
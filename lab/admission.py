@@ -0,0 +1,281 @@
+import os, math, time, threading
+from collections import OrderedDict, deque
+import flask
+import lab.metrics as metrics
+
+ENABLED = os.environ.get("LAB_ADMISSION", "1") == "1"
+# Database work admitted at once per process, shared fairly between teams.
+SLOTS = int(os.environ.get("LAB_ADMISSION_SLOTS", "32"))
+QUEUE_TIMEOUT = float(os.environ.get("LAB_ADMISSION_QUEUE_TIMEOUT", "2"))
+# Limits apply per team, but team names and cookies are chosen by the client:
+# one address gets at most this many teams' worth of budget, enough for a
+# classroom behind NAT, so rotating them gains little. 0 turns the cap off.
+TEAMS_PER_ADDRESS = int(os.environ.get("LAB_ADMISSION_TEAMS_PER_ADDRESS", "30"))
+MAX_TEAMS = 10000
+
+# route: (tokens per second, burst, concurrent queries per team, cost)
+# The cost is how many deficit round-robin credits one request spends, so a
+# SLEEP() probe weighs more than a lookup when teams compete for slots.
+LIMITS = {
+    "sqli_basic": (5, 20, 2, 1),
+    "sqli_union": (10, 30, 2, 2),
+    "sqli_error": (10, 30, 2, 1),
+    "sqli_boolean": (50, 200, 4, 1),
+    "sqli_time": (2, 10, 2, 4),
+    "sqli_to_rce": (10, 30, 2, 2),
+}
+
+
+def parse_limits(value):
+    # LAB_ADMISSION_LIMITS=sqli_time=1:5:1,sqli_boolean=100:400:8
+    limits = dict(LIMITS)
+    for item in filter(None, value.split(",")):
+        route, _, spec = item.partition("=")
+        rate, burst, concurrency, *cost = spec.split(":")
+        cost = int(cost[0]) if cost else limits.get(route, (0, 0, 0, 1))[3]
+        limits[route.strip()] = (float(rate), float(burst), int(concurrency), cost)
+    return limits
+
+
+LIMITS = parse_limits(os.environ.get("LAB_ADMISSION_LIMITS", ""))
+
+
+class Rejected(Exception):
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBuckets:
+    def __init__(self, max_keys=MAX_TEAMS):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        now = time.monotonic()
+        with self.lock:
+            tokens, last = self.buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_keys:
+                # Least recently seen teams; a fresh bucket is full anyway.
+                self.buckets.popitem(last=False)
+        return wait
+
+
+class Waiter:
+    def __init__(self, caps, cost):
+        # [(key, concurrent queries allowed under it)], team first.
+        self.caps = caps
+        self.cost = cost
+        self.granted = False
+
+
+class FairScheduler:
+    """Hands out database slots across teams with deficit round-robin."""
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.used = 0
+        self.active = {}
+        self.queues = OrderedDict()
+        self.deficits = {}
+        self.cond = threading.Condition()
+
+    def _eligible(self, waiter):
+        return all(self.active.get(key, 0) < limit for key, limit in waiter.caps)
+
+    def _grant(self, waiter):
+        waiter.granted = True
+        self.used += 1
+        for key, _ in waiter.caps:
+            self.active[key] = self.active.get(key, 0) + 1
+
+    def _dispatch(self):
+        granted = False
+        while self.used < self.slots and self.queues:
+            progress = False
+            for team in list(self.queues):
+                if self.used >= self.slots:
+                    break
+                queue = self.queues[team]
+                # The team just served goes to the back of the round.
+                self.queues.move_to_end(team)
+                self.deficits[team] = self.deficits.get(team, 0) + 1
+                while (
+                    queue
+                    and self.used < self.slots
+                    and queue[0].cost <= self.deficits[team]
+                    and self._eligible(queue[0])
+                ):
+                    waiter = queue.popleft()
+                    self.deficits[team] -= waiter.cost
+                    self._grant(waiter)
+                    granted = progress = True
+                if not queue:
+                    del self.queues[team]
+                    self.deficits.pop(team, None)
+                elif not self._eligible(queue[0]):
+                    # Over a cap; credit would only pile up.
+                    self.deficits[team] = min(self.deficits[team], queue[0].cost)
+                else:
+                    progress = True
+            if not progress:
+                break
+        if granted:
+            self.cond.notify_all()
+
+    def acquire(self, team, caps, cost, timeout):
+        waiter = Waiter(caps, cost)
+        with self.cond:
+            if not self.queues and self.used < self.slots and self._eligible(waiter):
+                self._grant(waiter)
+                return waiter
+            queue = self.queues.setdefault(team, deque())
+            if len(queue) >= caps[0][1] * 2:
+                raise Rejected("queue_full", 1.0)
+            queue.append(waiter)
+            self._dispatch()
+            deadline = time.monotonic() + timeout
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    queue.remove(waiter)
+                    if not queue:
+                        self.queues.pop(team, None)
+                        self.deficits.pop(team, None)
+                    raise Rejected("queue_timeout", 1.0)
+                self.cond.wait(remaining)
+        return waiter
+
+    def release(self, waiter):
+        with self.cond:
+            self.used -= 1
+            for key, _ in waiter.caps:
+                count = self.active[key] - 1
+                if count:
+                    self.active[key] = count
+                else:
+                    del self.active[key]
+            self._dispatch()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "slots": self.slots,
+                "used": self.used,
+                "queued": sum(len(queue) for queue in self.queues.values()),
+                "teams_queued": len(self.queues),
+            }
+
+
+_buckets = TokenBuckets()
+_scheduler = FairScheduler(SLOTS)
+_warned = set()
+
+
+def warn_once(key, message):
+    if key not in _warned and len(_warned) < MAX_TEAMS:
+        _warned.add(key)
+        print(f"[WARN] {message}")
+
+
+def admit(team, address, route, queue=True):
+    rate, burst, concurrency, cost = LIMITS[route]
+    caps = [((team, route), concurrency)]
+    wait = _buckets.take((team, route), rate, burst)
+    if wait:
+        raise Rejected("rate", wait)
+    if TEAMS_PER_ADDRESS:
+        factor = TEAMS_PER_ADDRESS
+        caps.append(((("address", address), route), concurrency * factor))
+        wait = _buckets.take(caps[1][0], rate * factor, burst * factor)
+        if wait:
+            warn_once(
+                address,
+                f"{address} reached the per-address limit on {route}; if more "
+                f"than {factor} teams share it, raise LAB_ADMISSION_TEAMS_PER_ADDRESS",
+            )
+            raise Rejected("address", wait)
+    if not queue:
+        return None
+    start = time.perf_counter()
+    waiter = _scheduler.acquire(team, caps, cost, QUEUE_TIMEOUT)
+    metrics.observe(
+        "lab_admission_wait_seconds", time.perf_counter() - start, (("route", route),)
+    )
+    return waiter
+
+
+def release(waiter):
+    _scheduler.release(waiter)
+
+
+def stats():
+    return _scheduler.stats()
+
+
+def client_key(known_team):
+    team = known_team()
+    # Never a freshly minted id: every cookieless request would get its own.
+    return f"team:{team}" if team else f"addr:{flask.request.remote_addr}"
+
+
+def init_app(app, known_team):
+    """Admit requests per team; known_team() must not invent one."""
+
+    @app.before_request
+    def admission():
+        route = flask.request.endpoint
+        if not ENABLED or route not in LIMITS:
+            return None
+        # Only requests that reach the database: a bare GET renders the form.
+        if flask.request.method != "POST" and not flask.request.args:
+            return None
+        # The async server must not block its event loop in the fair queue;
+        # its connection pools already bound database work.
+        queue = not flask.request.environ.get("lab.async")
+        try:
+            address = flask.request.remote_addr
+            if TEAMS_PER_ADDRESS and "X-Forwarded-For" in flask.request.headers:
+                warn_once(
+                    "X-Forwarded-For",
+                    f"Requests arrive through a proxy at {address}; every team "
+                    "behind it shares one per-address admission limit. Raise "
+                    "LAB_ADMISSION_TEAMS_PER_ADDRESS or set it to 0",
+                )
+            flask.g.admission = admit(client_key(known_team), address, route, queue)
+        except Rejected as e:
+            metrics.inc(
+                "lab_admission_rejected_total", (("route", route), ("reason", e.reason))
+            )
+            return (
+                "Too many requests from your team, slow down",
+                429,
+                {"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+            )
+        return None
+
+    @app.teardown_request
+    def release_slot(_):
+        # Streamed pages tear down once the body has been sent.
+        waiter = flask.g.pop("admission", None)
+        if waiter is not None:
+            release(waiter)
+
+
+def _reset_after_fork():
+    global _buckets, _scheduler
+    _buckets = TokenBuckets()
+    _scheduler = FairScheduler(SLOTS)
+    _warned.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
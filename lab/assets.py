@@ -0,0 +1,112 @@
+import os, re, gzip, hashlib
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
+# Every page stylesheet is served together with the shared base styles.
+BASE = "base.css"
+MAX_AGE = 365 * 24 * 60 * 60
+
+COMMENT = re.compile(r"/\*.*?\*/", re.S)
+STRING = re.compile(r"(\"(?:\\.|[^\"\\])*\"|'(?:\\.|[^'\\])*')")
+SPACE = re.compile(r"\s+")
+PUNCTUATION = re.compile(r"\s*([{};,>])\s*")
+# "property: value" inside a block; a selector such as "form :focus" keeps
+# its space, since it is followed by "{" rather than ";" or "}".
+DECLARATION = re.compile(r"([{;][-\w]+)\s*:\s*(?=[^{};]*[;}])")
+# Linked stylesheets in the templates, which have to be bundled.
+STYLESHEET = re.compile(r"url_for\('static', filename='([^']+\.css)'\)")
+
+# name -> (bundle name, etag, {encoding: body})
+_bundles = {}
+_files = {}
+
+
+def minify(css):
+    parts = STRING.split(COMMENT.sub("", css))
+    for i in range(0, len(parts), 2):
+        part = SPACE.sub(" ", parts[i])
+        part = PUNCTUATION.sub(r"\1", part)
+        part = DECLARATION.sub(r"\1:", part)
+        parts[i] = part.replace(";}", "}")
+    return "".join(parts).strip()
+
+
+def encode(body):
+    bodies = {"identity": body, "gzip": gzip.compress(body, 9, mtime=0)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body, quality=11)
+    return bodies
+
+
+def build(static_dir=STATIC_DIR):
+    bundles, files = {}, {}
+    for name in sorted(os.listdir(static_dir)):
+        if not name.endswith(".css"):
+            continue
+        sources = [name] if name == BASE else [BASE, name]
+        css = []
+        for source in sources:
+            with open(os.path.join(static_dir, source), encoding="utf-8") as f:
+                css.append(f.read())
+        body = minify("\n".join(css)).encode()
+        digest = hashlib.sha256(body).hexdigest()[:12]
+        bundle = f"{name[:-4]}.{digest}.css"
+        bundles[name] = bundle
+        files[bundle] = (digest, encode(body))
+    return bundles, files
+
+
+def check_templates(env):
+    # Only bundles carry base.css: a page linking a plain static stylesheet
+    # would render without the base styles.
+    for template in env.list_templates():
+        source = env.loader.get_source(env, template)[0]
+        for name in STYLESHEET.findall(source):
+            if name not in _bundles:
+                raise RuntimeError(f"{template} links {name}, which is not bundled")
+
+
+def url_for(endpoint, **values):
+    if endpoint == "static" and values.get("filename") in _bundles:
+        return flask.url_for("assets", name=_bundles[values.pop("filename")], **values)
+    return flask.url_for(endpoint, **values)
+
+
+def pick_encoding(bodies):
+    accepted = flask.request.accept_encodings
+    for encoding in ("br", "gzip"):
+        if encoding in bodies and accepted[encoding]:
+            return encoding
+    return "identity"
+
+
+def init_app(app):
+    global _bundles, _files
+    _bundles, _files = build(app.static_folder or STATIC_DIR)
+    # Templates keep calling url_for('static', ...); bundled stylesheets are
+    # rewritten to their fingerprinted name.
+    app.jinja_env.globals["url_for"] = url_for
+    check_templates(app.jinja_env)
+
+    @app.route("/assets/<name>", methods=["GET"])
+    def assets(name):
+        if name not in _files:
+            flask.abort(404)
+        digest, bodies = _files[name]
+        response = flask.Response(mimetype="text/css")
+        response.headers["Cache-Control"] = f"public, max-age={MAX_AGE}, immutable"
+        response.headers["Vary"] = "Accept-Encoding"
+        encoding = pick_encoding(bodies)
+        response.set_etag(f"{digest}-{encoding}")
+        if flask.request.if_none_match.contains(f"{digest}-{encoding}"):
+            response.status_code = 304
+            return response
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+        response.set_data(bodies[encoding])
+        return response
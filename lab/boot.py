@@ -0,0 +1,32 @@
+import os, time, contextlib
+
+# entrypoint.sh exports the container start time so the boot report covers
+# mysqld startup as well.
+STARTED = float(os.environ.get("LAB_BOOT_STARTED") or time.time())
+
+phases = {}
+ready = False
+
+
+@contextlib.contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = round((time.perf_counter() - start) * 1000, 1)
+        print(f"[INFO] Boot phase {name} took {phases[name]} ms")
+
+
+def since_start():
+    return round((time.time() - STARTED) * 1000, 1)
+
+
+def mark_ready():
+    global ready
+    ready = True
+    print(f"[INFO] Ready {since_start()} ms after start ({phases})")
+
+
+def report():
+    return {"ready": ready, "phases": phases, "since_start_ms": since_start()}
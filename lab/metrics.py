@@ -0,0 +1,324 @@
+import os, json, time, threading
+from bisect import bisect_left
+import flask
+
+# Seconds buckets shared by every latency histogram.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000)
+
+METRICS = {
+    "lab_http_requests_total": ("counter", "HTTP requests served"),
+    "lab_http_request_duration_seconds": (
+        "histogram",
+        "Time from request start until the response body was sent",
+    ),
+    "lab_http_requests_in_flight": ("gauge", "Requests currently being served"),
+    "lab_db_pool_wait_seconds": (
+        "histogram",
+        "Time spent waiting for a pooled connection",
+    ),
+    "lab_db_connect_seconds": ("histogram", "Time to check out a ready connection"),
+    "lab_db_execute_seconds": ("histogram", "Time spent in cursor.execute()"),
+    "lab_db_fetch_seconds": ("histogram", "Time spent fetching rows per query"),
+    "lab_db_rows": ("histogram", "Rows fetched per query"),
+    "lab_db_errors_total": ("counter", "Database errors by exception class"),
+    "lab_db_pool_connections": ("gauge", "Open pooled connections by state"),
+    "lab_admission_wait_seconds": (
+        "histogram",
+        "Time admitted requests queued for a database slot",
+    ),
+    "lab_admission_rejected_total": (
+        "counter",
+        "Requests turned away with a 429 by route and reason",
+    ),
+    "lab_db_breaker_open": (
+        "gauge",
+        "Processes whose database circuit breaker is open or probing",
+    ),
+    "lab_db_breaker_transitions_total": (
+        "counter",
+        "Database circuit breaker state changes by new state",
+    ),
+    "lab_exec_runs_total": ("counter", "Sandboxed script runs by outcome"),
+    "lab_exec_seconds": (
+        "histogram",
+        "Time from queueing a script until its sandbox worker answered",
+    ),
+    "lab_exec_recycled_total": ("counter", "Sandbox workers replaced"),
+    "lab_page_cache_requests_total": (
+        "counter",
+        "Cacheable page requests by route and hit, miss or bypass",
+    ),
+}
+
+# With several workers every process writes its totals here so any worker can
+# answer a scrape for the whole server.
+METRICS_DIR = os.environ.get("LAB_METRICS_DIR")
+FLUSH_INTERVAL = 5.0
+MAX_SHARDS = 256
+
+_local = threading.local()
+_shards = []
+_retired = {"counters": {}, "gauges": {}, "histograms": {}}
+_shards_lock = threading.Lock()
+_flusher = None
+
+
+def _new_shard():
+    return {"counters": {}, "gauges": {}, "histograms": {}}
+
+
+def _shard():
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = _new_shard()
+        with _shards_lock:
+            _shards.append((threading.current_thread(), shard))
+            if len(_shards) > MAX_SHARDS:
+                _retire_dead_shards()
+    return shard
+
+
+def _merge(into, shard):
+    for key, value in shard["counters"].copy().items():
+        into["counters"][key] = into["counters"].get(key, 0) + value
+    for key, value in shard["gauges"].copy().items():
+        into["gauges"][key] = into["gauges"].get(key, 0) + value
+    for key, (counts, total, count, buckets) in shard["histograms"].copy().items():
+        current = into["histograms"].get(key)
+        if current is None:
+            into["histograms"][key] = [list(counts), total, count, buckets]
+        else:
+            current[0] = [a + b for a, b in zip(current[0], counts)]
+            current[1] += total
+            current[2] += count
+
+
+def _retire_dead_shards():
+    # Request threads of the development server are short-lived; fold their
+    # counters into one aggregate instead of keeping a shard per thread.
+    alive = []
+    for thread, shard in _shards:
+        if thread.is_alive():
+            alive.append((thread, shard))
+        else:
+            _merge(_retired, shard)
+    _shards[:] = alive
+
+
+def inc(name, labels=(), value=1):
+    counters = _shard()["counters"]
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def add(name, labels=(), value=1):
+    gauges = _shard()["gauges"]
+    key = (name, labels)
+    gauges[key] = gauges.get(key, 0) + value
+
+
+def observe(name, value, labels=(), buckets=BUCKETS):
+    histograms = _shard()["histograms"]
+    key = (name, labels)
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = [[0] * (len(buckets) + 1), 0.0, 0, buckets]
+    histogram[0][bisect_left(buckets, value)] += 1
+    histogram[1] += value
+    histogram[2] += 1
+
+
+def snapshot():
+    totals = _new_shard()
+    with _shards_lock:
+        _retire_dead_shards()
+        _merge(totals, _retired)
+        for _, shard in _shards:
+            _merge(totals, shard)
+    return totals
+
+
+def _encode(totals):
+    return {
+        kind: [[name, list(labels), value] for (name, labels), value in values.items()]
+        for kind, values in totals.items()
+    }
+
+
+def _decode(data):
+    return {
+        kind: {
+            (name, tuple(tuple(label) for label in labels)): (
+                value if kind != "histograms" else [*value[:3], tuple(value[3])]
+            )
+            for name, labels, value in values
+        }
+        for kind, values in data.items()
+    }
+
+
+def flush():
+    if not METRICS_DIR:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(_encode(snapshot()), f)
+    os.replace(path + ".tmp", path)
+
+
+def _flush_forever():
+    while True:
+        try:
+            flush()
+        except Exception as e:
+            # Keep flushing: a dead thread would silently drop this worker
+            # from the merged /metrics.
+            print(f"Failed to write metrics: {type(e).__name__}: {str(e)}")
+        time.sleep(FLUSH_INTERVAL)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def collect():
+    if not METRICS_DIR:
+        return snapshot()
+
+    flush()
+    totals = _new_shard()
+    for name in os.listdir(METRICS_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, name)) as f:
+                data = _decode(json.load(f))
+        except (OSError, ValueError):
+            continue
+        if not _pid_alive(int(name[:-5])):
+            # Counters of an exited worker still count towards the totals, its
+            # gauges no longer describe anything.
+            data["gauges"] = {}
+        _merge(totals, data)
+    return totals
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(totals):
+    lines = []
+    by_name = {}
+    for kind in ("counters", "gauges", "histograms"):
+        for (name, labels), value in totals[kind].items():
+            by_name.setdefault(name, []).append((labels, value))
+
+    for name in sorted(by_name):
+        kind, description = METRICS.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name], key=lambda item: item[0]):
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+                continue
+            counts, total, count, buckets = value
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, float("inf")), counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(
+                    (*labels, ("le", _format_number(float(bound))))
+                )
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def prepare_dir(path):
+    global METRICS_DIR
+    METRICS_DIR = path
+    os.makedirs(path, exist_ok=True)
+    # Files left by a previous run would be added to this run's totals.
+    for name in os.listdir(path):
+        if name.endswith(".json"):
+            os.remove(os.path.join(path, name))
+
+
+def init_app(app):
+    @app.before_request
+    def start_timer():
+        if METRICS_DIR and _flusher is None:
+            start_flusher()
+        flask.g.metrics_start = time.perf_counter()
+        add("lab_http_requests_in_flight")
+
+    @app.after_request
+    def record_request(response):
+        start = flask.g.pop("metrics_start", None)
+        if start is None:
+            return response
+        route = flask.request.endpoint or "unmatched"
+        status = str(response.status_code)
+
+        def finish():
+            observe(
+                "lab_http_request_duration_seconds",
+                time.perf_counter() - start,
+                (("route", route),),
+            )
+            inc("lab_http_requests_total", (("route", route), ("status", status)))
+            add("lab_http_requests_in_flight", value=-1)
+
+        # Streamed pages are still rendering here; count them once the body
+        # has been sent.
+        response.call_on_close(finish)
+        return response
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return flask.Response(
+            exposition(collect()), mimetype="text/plain; version=0.0.4"
+        )
+
+
+def start_flusher():
+    global _flusher
+    with _shards_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever, daemon=True)
+            _flusher.start()
+
+
+def _reset_after_fork():
+    # Workers report only what they served; the master's bootstrap queries
+    # would otherwise be counted once per worker.
+    global _local, _shards, _retired, _shards_lock, _flusher
+    _local = threading.local()
+    _shards = []
+    _retired = _new_shard()
+    _shards_lock = threading.Lock()
+    _flusher = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
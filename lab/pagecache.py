@@ -0,0 +1,162 @@
+import os, inspect, hashlib, functools, threading
+from collections import OrderedDict
+import flask
+import lab.assets as assets
+import lab.metrics as metrics
+
+ENABLED = os.environ.get("LAB_PAGE_CACHE", "1") == "1"
+MAX_ENTRIES = int(os.environ.get("LAB_PAGE_CACHE_ENTRIES", "256"))
+MAX_BYTES = int(os.environ.get("LAB_PAGE_CACHE_BYTES", str(8 * 1024 * 1024)))
+
+# key -> (etag, mimetype, {encoding: body}, size)
+_entries = OrderedDict()
+_size = 0
+_lock = threading.Lock()
+_counts = {"hit": 0, "miss": 0, "bypass": 0}
+
+
+def uncacheable():
+    # Called when a request checks out a database connection: its page
+    # depends on data a team can change, so it is never stored.
+    if flask.has_request_context():
+        flask.g.pagecache_bypass = True
+
+
+def count(result):
+    _counts[result] += 1
+    metrics.inc(
+        "lab_page_cache_requests_total",
+        (("route", flask.request.endpoint), ("result", result)),
+    )
+
+
+def get(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+        return entry
+
+
+def put(key, entry):
+    global _size
+    with _lock:
+        old = _entries.pop(key, None)
+        if old is not None:
+            _size -= old[3]
+        _entries[key] = entry
+        _size += entry[3]
+        while _entries and (len(_entries) > MAX_ENTRIES or _size > MAX_BYTES):
+            _size -= _entries.popitem(last=False)[1][3]
+
+
+def clear():
+    global _size
+    with _lock:
+        _entries.clear()
+        _size = 0
+
+
+def stats():
+    with _lock:
+        return {**_counts, "entries": len(_entries), "bytes": _size}
+
+
+def cache_key(session_keys):
+    request = flask.request
+    if not ENABLED:
+        return None
+    # Pages showing a logged-in user's data are never shared.
+    if request.method not in ("GET", "HEAD") or any(
+        flask.session.get(name) is not None for name in session_keys
+    ):
+        count("bypass")
+        return None
+    return (
+        request.endpoint,
+        request.path,
+        tuple(sorted(request.args.items(multi=True))),
+    )
+
+
+def respond(entry):
+    etag, mimetype, bodies, _ = entry
+    encoding = assets.pick_encoding(bodies)
+    response = flask.Response(mimetype=mimetype)
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["Vary"] = "Accept-Encoding"
+    response.set_etag(f"{etag}-{encoding}")
+    if flask.request.if_none_match.contains(f"{etag}-{encoding}"):
+        response.status_code = 304
+        return response
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.set_data(bodies[encoding])
+    return response
+
+
+def store(key, rv):
+    response = flask.make_response(rv)
+    if (
+        flask.g.pop("pagecache_bypass", False)
+        or flask.session.modified
+        or response.status_code != 200
+        or response.is_streamed
+        or "Set-Cookie" in response.headers
+    ):
+        count("bypass")
+        return response
+    body = response.get_data()
+    bodies = assets.encode(body)
+    etag = hashlib.sha256(body).hexdigest()[:16]
+    entry = (etag, response.mimetype, bodies, sum(map(len, bodies.values())))
+    put(key, entry)
+    count("miss")
+    return respond(entry)
+
+
+def cached(session_keys=()):
+    """Serve a view from memory while its page only depends on the URL.
+
+    Pages that touched the database, changed the session or read one of
+    `session_keys` while it was set are rendered afresh every time.
+    """
+
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+
+            @functools.wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                key = cache_key(session_keys)
+                if key is None:
+                    return await view(*args, **kwargs)
+                entry = get(key)
+                if entry is not None:
+                    count("hit")
+                    return respond(entry)
+                return store(key, await view(*args, **kwargs))
+
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = cache_key(session_keys)
+            if key is None:
+                return view(*args, **kwargs)
+            entry = get(key)
+            if entry is not None:
+                count("hit")
+                return respond(entry)
+            return store(key, view(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+def _reset_after_fork():
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,244 @@
+import os, sys, glob, json, time, random, signal, threading, contextvars
+from collections import Counter
+import flask
+
+PROFILE_DIR = os.environ.get("LAB_PROFILE_DIR", "logs/profiles")
+# What SIGUSR2 turns on.
+DEFAULT_RATE = float(os.environ.get("LAB_PROFILE_RATE", "0.1"))
+DEFAULT_ROUTE = os.environ.get("LAB_PROFILE_ROUTE") or None
+DEFAULT_DURATION = float(os.environ.get("LAB_PROFILE_DURATION", "300"))
+FLUSH_INTERVAL = 5.0
+PHASES = ("connect", "execute", "fetch", "render")
+
+# None while profiling is off; request hooks check nothing else.
+_config = None
+_active = contextvars.ContextVar("lab_profile", default=None)
+_folded = Counter()
+_lock = threading.Lock()
+_last_flush = 0.0
+# serve.py's master, which relays control file changes to every worker.
+_leader = None
+
+
+class Capture:
+    """Self time per call stack of one request, from sys.setprofile events."""
+
+    def __init__(self, route, stacks):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.start = time.perf_counter()
+        self.stacks = stacks
+        self.paths = [route]
+        self.totals = Counter()
+        self.last = self.start
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter()
+        self.totals[self.paths[-1]] += now - self.last
+        if event == "call":
+            code = frame.f_code
+            # Parent directory included: flask/app.py is not the lab's app.py.
+            where = os.path.join(*code.co_filename.split(os.sep)[-2:])
+            name = f"{code.co_name} ({where}:{code.co_firstlineno})"
+            self.paths.append(f"{self.paths[-1]};{name}")
+        elif event == "c_call":
+            name = getattr(arg, "__qualname__", None) or repr(arg)
+            module = getattr(arg, "__module__", None)
+            self.paths.append(
+                f"{self.paths[-1]};{module}.{name}"
+                if module
+                else f"{self.paths[-1]};{name}"
+            )
+        elif len(self.paths) > 1:
+            # Returns from frames entered before the profiler was installed
+            # leave the root in place.
+            self.paths.pop()
+        self.last = time.perf_counter()
+
+    def server_timing(self):
+        phases = [
+            f"{name};dur={seconds * 1000:.2f}"
+            for name, seconds in self.phases.items()
+            if seconds
+        ]
+        phases.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.2f}")
+        return ", ".join(phases)
+
+
+def phase(name, seconds):
+    # Called by the database layer and template rendering on every request;
+    # a context variable lookup when nothing is being profiled.
+    capture = _active.get()
+    if capture is not None:
+        capture.phases[name] += seconds
+
+
+def configure(rate, route=None, duration=DEFAULT_DURATION):
+    """Profile a fraction of requests, optionally of one route, for a while."""
+    config = None
+    if rate > 0:
+        config = {
+            "rate": min(rate, 1.0),
+            "route": route,
+            "until": time.time() + duration,
+        }
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, "control.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(config, f)
+    os.replace(f"{path}.tmp", path)
+    apply(config)
+    if _leader:
+        os.kill(_leader, signal.SIGUSR1)
+    return config
+
+
+def reload():
+    try:
+        with open(os.path.join(PROFILE_DIR, "control.json")) as f:
+            apply(json.load(f))
+    except (OSError, ValueError):
+        apply(None)
+
+
+def apply(config):
+    global _config
+    if config is None and _config is not None:
+        flush()
+    _config = config
+    state = (
+        f"{config['rate']:g} of {config['route'] or 'all'} requests"
+        if config
+        else "off"
+    )
+    print(f"[INFO] Profiling {state} in process {os.getpid()}")
+
+
+def toggle():
+    return configure(0) if _config else configure(DEFAULT_RATE, DEFAULT_ROUTE)
+
+
+def status():
+    return {"config": _config, "pid": os.getpid(), "dir": PROFILE_DIR}
+
+
+def flush():
+    global _last_flush
+    with _lock:
+        lines = [
+            f"{stack} {round(micros)}"
+            for stack, micros in _folded.items()
+            if micros >= 1
+        ]
+        _last_flush = time.monotonic()
+    if not lines:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"requests.{os.getpid()}.folded")
+    with open(f"{path}.tmp", "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(f"{path}.tmp", path)
+
+
+def collapsed():
+    """Stacks of every process in the directory, merged, in collapsed format."""
+    flush()
+    totals = Counter()
+    for path in glob.glob(os.path.join(PROFILE_DIR, "requests.*.folded")):
+        with open(path) as f:
+            for line in f:
+                stack, _, micros = line.rstrip("\n").rpartition(" ")
+                if stack:
+                    totals[stack] += int(micros)
+    return "".join(f"{stack} {micros}\n" for stack, micros in sorted(totals.items()))
+
+
+def clear():
+    with _lock:
+        _folded.clear()
+    for path in glob.glob(os.path.join(PROFILE_DIR, "requests.*.folded")):
+        os.remove(path)
+
+
+def start_request():
+    config = _config
+    if config is None:
+        return
+    if time.time() > config["until"]:
+        apply(None)
+        return
+    route = flask.request.endpoint
+    if route is None or (config["route"] and route != config["route"]):
+        return
+    if random.random() >= config["rate"]:
+        return
+    # The async server runs many requests on one thread, so its stacks would
+    # mix; those requests only get phase timings.
+    stacks = not flask.request.environ.get("lab.async")
+    capture = Capture(route, stacks)
+    flask.g.profile = (capture, _active.set(capture))
+    if stacks:
+        sys.setprofile(capture)
+
+
+def finish_request():
+    profile = flask.g.pop("profile", None)
+    if profile is None:
+        return
+    capture, token = profile
+    if capture.stacks:
+        sys.setprofile(None)
+        with _lock:
+            for stack, seconds in capture.totals.items():
+                _folded[stack] += seconds * 1_000_000
+    _active.reset(token)
+    if time.monotonic() - _last_flush > FLUSH_INTERVAL:
+        flush()
+
+
+def init_app(app):
+    app.before_request(start_request)
+
+    @app.after_request
+    def server_timing(response):
+        capture = _active.get()
+        if capture is not None:
+            # Streamed pages render after the headers are sent, so their
+            # render phase only shows up in the stacks.
+            response.headers["Server-Timing"] = capture.server_timing()
+        return response
+
+    app.teardown_request(lambda _: finish_request())
+
+    render_start = contextvars.ContextVar("lab_render_start", default=None)
+
+    def before_render(sender, **extra):
+        if _active.get() is not None:
+            render_start.set(time.perf_counter())
+
+    def rendered(sender, **extra):
+        start = render_start.get()
+        if start is not None:
+            render_start.set(None)
+            phase("render", time.perf_counter() - start)
+
+    flask.before_render_template.connect(before_render, app, weak=False)
+    flask.template_rendered.connect(rendered, app, weak=False)
+
+
+def install_signals(follower=False):
+    # SIGUSR2 toggles profiling. serve.py workers also reload the control
+    # file on SIGUSR1, which the master relays whenever it changes.
+    global _leader
+    signal.signal(signal.SIGUSR2, lambda *_: toggle())
+    if follower:
+        _leader = os.getppid()
+        signal.signal(signal.SIGUSR1, lambda *_: reload())
+
+
+def _reset_after_fork():
+    global _lock, _folded
+    _lock = threading.Lock()
+    _folded = Counter()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
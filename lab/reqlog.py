@@ -0,0 +1,176 @@
+import os, json, time, queue, fcntl, threading
+import flask
+
+ENABLED = os.environ.get("LAB_LOG_ENABLED", "1") == "1"
+LOG_FILE = os.environ.get("LAB_LOG_FILE", "logs/requests.jsonl")
+MAX_BYTES = int(os.environ.get("LAB_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+BACKUPS = int(os.environ.get("LAB_LOG_BACKUPS", "5"))
+QUEUE_SIZE = int(os.environ.get("LAB_LOG_QUEUE", "10000"))
+
+# Once the queue is this full only one record in SAMPLE_RATE is kept, so a
+# burst degrades to sampling before it has to drop everything.
+HIGH_WATER = int(QUEUE_SIZE * 0.8)
+SAMPLE_RATE = 10
+BATCH_SIZE = 1000
+FLUSH_INTERVAL = 0.5
+
+_queue = queue.Queue(QUEUE_SIZE)
+_lock = threading.Lock()
+_writer = None
+_counts = {"sampled_out": 0, "dropped": 0, "seen": 0}
+
+
+def record(**fields):
+    if not ENABLED:
+        return
+    if _writer is None:
+        _start_writer()
+
+    _counts["seen"] += 1
+    if _queue.qsize() >= HIGH_WATER:
+        if _counts["seen"] % SAMPLE_RATE:
+            _counts["sampled_out"] += 1
+            return
+        fields["sample_rate"] = SAMPLE_RATE
+
+    fields["ts"] = round(time.time(), 6)
+    fields["pid"] = os.getpid()
+    try:
+        _queue.put_nowait(fields)
+    except queue.Full:
+        _counts["dropped"] += 1
+
+
+def current_route():
+    return flask.request.endpoint if flask.has_request_context() else None
+
+
+def _start_writer():
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(
+                target=LogWriter(LOG_FILE).run, name="reqlog", daemon=True
+            )
+            _writer.start()
+
+
+class LogWriter:
+    def __init__(self, path):
+        self.path = path
+        self.fd = None
+        self.reported = {"sampled_out": 0, "dropped": 0}
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def reopen_if_rotated(self):
+        # Another worker may have rotated the file underneath this one.
+        try:
+            current = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            current = None
+        if self.fd is None or current != os.fstat(self.fd).st_ino:
+            if self.fd is not None:
+                os.close(self.fd)
+            self.open()
+
+    def rotate(self):
+        with open(self.path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if os.stat(self.path).st_size < MAX_BYTES:
+                    return
+            except FileNotFoundError:
+                return
+            for index in range(BACKUPS - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            if BACKUPS:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+
+    def shed_summary(self):
+        summary = {}
+        for key in ("sampled_out", "dropped"):
+            delta = _counts[key] - self.reported[key]
+            if delta:
+                summary[key] = delta
+                self.reported[key] = _counts[key]
+        if summary:
+            summary.update(type="log_shed", ts=round(time.time(), 6), pid=os.getpid())
+        return summary
+
+    def write(self, records):
+        self.reopen_if_rotated()
+        data = "".join(
+            json.dumps(item, default=str, ensure_ascii=False) + "\n" for item in records
+        ).encode()
+        # One write() per batch on an O_APPEND descriptor keeps lines from
+        # different workers from interleaving.
+        os.write(self.fd, data)
+        if os.fstat(self.fd).st_size >= MAX_BYTES:
+            self.rotate()
+
+    def run(self):
+        while True:
+            try:
+                records = [_queue.get(timeout=FLUSH_INTERVAL)]
+            except queue.Empty:
+                records = []
+            while len(records) < BATCH_SIZE:
+                try:
+                    records.append(_queue.get_nowait())
+                except queue.Empty:
+                    break
+            summary = self.shed_summary()
+            if summary:
+                records.append(summary)
+            if not records:
+                continue
+            try:
+                self.write(records)
+            except OSError as e:
+                print(f"Failed to write request log: {str(e)}")
+                time.sleep(FLUSH_INTERVAL)
+
+
+def init_app(app):
+    @app.before_request
+    def start_timer():
+        flask.g.reqlog_start = time.perf_counter()
+
+    @app.after_request
+    def log_request(response):
+        start = flask.g.pop("reqlog_start", None)
+        if start is None:
+            return response
+        fields = {
+            "type": "request",
+            "route": flask.request.endpoint,
+            "method": flask.request.method,
+            "path": flask.request.path,
+            "status": response.status_code,
+        }
+
+        def finish():
+            record(**fields, duration_ms=round((time.perf_counter() - start) * 1000, 3))
+
+        response.call_on_close(finish)
+        return response
+
+
+def _reset_after_fork():
+    global _queue, _lock, _writer, _counts
+    _queue = queue.Queue(QUEUE_SIZE)
+    _lock = threading.Lock()
+    _writer = None
+    _counts = {"sampled_out": 0, "dropped": 0, "seen": 0}
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
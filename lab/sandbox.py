@@ -0,0 +1,267 @@
+import os, sys, json, math, time, select, signal, builtins, resource, threading
+import subprocess
+from collections import OrderedDict
+import lab.metrics as metrics
+
+# Scripts run in separate interpreter processes so a slow or runaway one
+# costs a sandbox worker, never a web thread.
+WORKERS = int(os.environ.get("LAB_EXEC_WORKERS", "2"))
+MAX_RUNS = int(os.environ.get("LAB_EXEC_MAX_RUNS", "100"))
+CPU_LIMIT = float(os.environ.get("LAB_EXEC_CPU_SECONDS", "5"))
+TIMEOUT = float(os.environ.get("LAB_EXEC_TIMEOUT", "30"))
+MEMORY_LIMIT = int(os.environ.get("LAB_EXEC_MEMORY_MB", "256")) * 1024 * 1024
+QUEUE_TIMEOUT = float(os.environ.get("LAB_EXEC_QUEUE_TIMEOUT", "5"))
+CODE_CACHE = 128
+# Backoff between attempts to start a replacement worker, e.g. while fork
+# fails with EAGAIN or ENOMEM.
+RESPAWN_DELAY = 0.5
+MAX_RESPAWN_DELAY = 30
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Busy(Exception):
+    pass
+
+
+class CpuLimitExceeded(Exception):
+    pass
+
+
+# Sandbox worker side.
+
+
+def _cpu_limit_exceeded(signum, frame):
+    raise CpuLimitExceeded(f"CPU time limit of {CPU_LIMIT:g}s exceeded")
+
+
+def _load(path, cache):
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    code = cache.get(key)
+    if code is None:
+        with open(path) as f:
+            code = compile(f.read(), path, "exec")
+        cache[key] = code
+        while len(cache) > CODE_CACHE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(key)
+    return code
+
+
+def execute(path, cache):
+    # Only the soft limit moves: an unprivileged process cannot raise its
+    # hard limit again once lowered.
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime + CPU_LIMIT)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, resource.RLIM_INFINITY))
+    try:
+        exec(
+            _load(path, cache),
+            {"__name__": "__main__", "__file__": path, "__builtins__": builtins},
+        )
+        return {"status": "ok"}
+    except FileNotFoundError:
+        return {"status": "missing"}
+    except BaseException as e:
+        # After hitting a limit or being asked to exit, the worker is
+        # replaced rather than trusted with the next script.
+        fatal = isinstance(e, (CpuLimitExceeded, MemoryError)) or not isinstance(
+            e, Exception
+        )
+        return {"status": "error", "message": str(e), "fatal": fatal}
+    finally:
+        resource.setrlimit(
+            resource.RLIMIT_CPU, (resource.RLIM_INFINITY, resource.RLIM_INFINITY)
+        )
+
+
+def serve():
+    resource.setrlimit(resource.RLIMIT_AS, (MEMORY_LIMIT, MEMORY_LIMIT))
+    signal.signal(signal.SIGXCPU, _cpu_limit_exceeded)
+    # The protocol gets private copies of stdin and stdout; scripts print to
+    # the server's stderr and read from /dev/null.
+    jobs = os.fdopen(os.dup(0), "r")
+    replies = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(2, 1)
+    cache = OrderedDict()
+    for line in jobs:
+        reply = execute(json.loads(line)["path"], cache)
+        replies.write(json.dumps(reply) + "\n")
+        replies.flush()
+        if reply.get("fatal"):
+            break
+
+
+# Web process side.
+
+
+class Worker:
+    def __init__(self):
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+        # Its own session, so a timeout also kills what the script started.
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "lab.sandbox"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+            start_new_session=True,
+            text=True,
+        )
+        self.runs = 0
+
+    def run(self, path, timeout):
+        self.runs += 1
+        self.proc.stdin.write(json.dumps({"path": path}) + "\n")
+        self.proc.stdin.flush()
+        readable, _, _ = select.select([self.proc.stdout], [], [], timeout)
+        if not readable:
+            raise TimeoutError(f"Execution timed out after {timeout:g}s")
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError("Sandbox worker died")
+        return json.loads(line)
+
+    def kill(self):
+        try:
+            os.killpg(self.proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self.proc.wait()
+
+    def retire(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=1)
+        except (OSError, subprocess.TimeoutExpired):
+            self.kill()
+
+
+class Pool:
+    def __init__(self, size):
+        self.size = size
+        self.idle = []
+        self.busy = 0
+        self.starting = 0
+        self.cond = threading.Condition()
+        for _ in range(size):
+            self.idle.append(Worker())
+
+    def _replace(self):
+        # Keeps trying: giving up would shrink the pool for good, and with no
+        # worker left every script would wait out the queue timeout.
+        delay = RESPAWN_DELAY
+        while True:
+            try:
+                worker = Worker()
+                break
+            except OSError as e:
+                metrics.inc("lab_exec_spawn_failures_total")
+                print(
+                    f"[WARN] Could not start a sandbox worker: {str(e)}; "
+                    f"retrying in {delay:g}s"
+                )
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RESPAWN_DELAY)
+        with self.cond:
+            self.starting -= 1
+            self.idle.append(worker)
+            self.cond.notify()
+
+    def checkout(self, timeout):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while not self.idle:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise Busy("All sandbox workers are busy")
+                self.cond.wait(remaining)
+            self.busy += 1
+            return self.idle.pop()
+
+    def checkin(self, worker, healthy):
+        recycle = (
+            not healthy or worker.runs >= MAX_RUNS or worker.proc.poll() is not None
+        )
+        with self.cond:
+            self.busy -= 1
+            if not recycle:
+                self.idle.append(worker)
+                self.cond.notify()
+                return
+            self.starting += 1
+        metrics.inc("lab_exec_recycled_total")
+        if healthy:
+            worker.retire()
+        else:
+            worker.kill()
+        # Interpreter startup stays off the request that triggered it.
+        threading.Thread(target=self._replace, daemon=True).start()
+
+    def stats(self):
+        with self.cond:
+            return {
+                "workers": self.size,
+                "idle": len(self.idle),
+                "busy": self.busy,
+                "starting": self.starting,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = Pool(WORKERS)
+    return _pool
+
+
+def run(path):
+    """Execute a Python file in a sandbox worker, like exec(open(path).read()).
+
+    Raises FileNotFoundError, Busy, or an exception carrying the script's
+    error message.
+    """
+    pool = get_pool()
+    start = time.perf_counter()
+    worker = pool.checkout(QUEUE_TIMEOUT)
+    healthy = False
+    result = "error"
+    try:
+        reply = worker.run(path, TIMEOUT)
+        healthy = not reply.get("fatal")
+        result = reply["status"]
+    except TimeoutError:
+        result = "timeout"
+        raise
+    finally:
+        pool.checkin(worker, healthy)
+        metrics.inc("lab_exec_runs_total", (("result", result),))
+        metrics.observe("lab_exec_seconds", time.perf_counter() - start)
+    if result == "missing":
+        raise FileNotFoundError(path)
+    if result == "error":
+        raise RuntimeError(reply["message"])
+
+
+def _forget_pool_after_fork():
+    # The workers' pipes belong to the parent.
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pool_after_fork)
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,213 @@
+import os, json, time, fcntl, threading
+import flask.sessions
+
+# Session key and flags are generated once per deployment and shared by
+# every worker and replica through a file or the database.
+STORE = os.environ.get("LAB_SECRETS_STORE", "file")
+FILE = os.environ.get("LAB_SECRETS_FILE", "logs/secrets.json")
+REFRESH_INTERVAL = float(os.environ.get("LAB_SECRETS_REFRESH", "5"))
+# Session keys of earlier rotations that still verify cookies.
+KEEP_KEYS = 2
+NAMES = ("secret_key", "flag_1", "flag_2")
+# tenants.CONTROL_SCHEMA; imported by the database layer, so not from it.
+TABLE = "sqli_lab_control.lab_secrets"
+
+_values = None
+_loaded_at = 0.0
+_lock = threading.Lock()
+_connect = None
+
+
+def generate(name):
+    if name == "secret_key":
+        return os.urandom(24).hex()
+    return f"FLAG{{{os.urandom(12).hex()}}}"
+
+
+def fresh():
+    return {"version": 1, **{name: generate(name) for name in NAMES}, "old_keys": []}
+
+
+def rotated(values, names):
+    values = dict(values)
+    for name in names:
+        if name == "secret_key":
+            values["old_keys"] = [values["secret_key"], *values["old_keys"]][:KEEP_KEYS]
+        values[name] = generate(name)
+    values["version"] += 1
+    return values
+
+
+def _read_file():
+    with open(FILE) as f:
+        return json.load(f)
+
+
+def _update_file(change):
+    os.makedirs(os.path.dirname(FILE) or ".", exist_ok=True)
+    # Workers and replicas on one volume generate the values only once.
+    with open(f"{FILE}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            current = _read_file()
+        except FileNotFoundError:
+            current = None
+        values = change(current)
+        if values is not current:
+            fd = os.open(f"{FILE}.tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(values, f)
+            os.replace(f"{FILE}.tmp", FILE)
+        return values
+
+
+def _read_db():
+    conn = _connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"SELECT secrets FROM {TABLE} WHERE id = 1")
+        return json.loads(cursor.fetchone()[0])
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _update_db(change):
+    conn = _connect()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS {TABLE.split('.')[0]}")
+        cursor.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {TABLE} (
+                id TINYINT PRIMARY KEY,
+                secrets TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    ON UPDATE CURRENT_TIMESTAMP
+            );
+            """
+        )
+        # The first replica to boot wins; the others read its values.
+        cursor.execute(
+            f"INSERT IGNORE INTO {TABLE} (id, secrets) VALUES (1, %s)",
+            (json.dumps(fresh()),),
+        )
+        cursor.execute(f"SELECT secrets FROM {TABLE} WHERE id = 1 FOR UPDATE")
+        current = json.loads(cursor.fetchone()[0])
+        values = change(current)
+        if values is not current:
+            cursor.execute(
+                f"UPDATE {TABLE} SET secrets = %s WHERE id = 1", (json.dumps(values),)
+            )
+        conn.commit()
+        return values
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _update(change):
+    return _update_db(change) if STORE == "db" else _update_file(change)
+
+
+def refresh():
+    global _values, _loaded_at
+    # While one thread reads the store the others keep the cached values.
+    if not _lock.acquire(blocking=_values is None):
+        return
+    try:
+        if _values is not None and time.monotonic() - _loaded_at < REFRESH_INTERVAL:
+            return
+        try:
+            if _values is None:
+                _values = _update(lambda current: current or fresh())
+            else:
+                _values = _read_db() if STORE == "db" else _read_file()
+        except Exception as e:
+            if _values is None:
+                raise
+            print(f"[WARN] Could not refresh the shared secrets: {str(e)}")
+        _loaded_at = time.monotonic()
+    finally:
+        _lock.release()
+
+
+def values():
+    if _values is None or time.monotonic() - _loaded_at >= REFRESH_INTERVAL:
+        refresh()
+    return _values
+
+
+def get(name):
+    return values()[name]
+
+
+def rotate(names=NAMES):
+    """Replace some of the values everywhere; returns the new version.
+
+    Other processes pick them up within REFRESH_INTERVAL. Cookies signed
+    with one of the last KEEP_KEYS session keys stay valid.
+    """
+    global _values, _loaded_at
+    unknown = set(names) - set(NAMES)
+    if unknown:
+        raise ValueError(f"Unknown secrets: {', '.join(sorted(unknown))}")
+    new = _update(lambda current: rotated(current or fresh(), names))
+    with _lock:
+        _values = new
+        _loaded_at = time.monotonic()
+    return new["version"]
+
+
+def forget():
+    # Image builds: values baked into the image would be shared by every
+    # container started from it.
+    global _values
+    if STORE == "db":
+        conn = _connect()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+        finally:
+            cursor.close()
+            conn.close()
+    else:
+        try:
+            os.remove(FILE)
+        except FileNotFoundError:
+            pass
+    _values = None
+
+
+def status():
+    current = values()
+    return {
+        "store": STORE,
+        "version": current["version"],
+        "old_keys": len(current["old_keys"]),
+    }
+
+
+class SessionInterface(flask.sessions.SecureCookieSessionInterface):
+    # Every cookie is signed or checked here, so a rotated key takes effect
+    # in each worker without a restart.
+    def get_signing_serializer(self, app):
+        current = values()
+        app.secret_key = current["secret_key"]
+        app.config["SECRET_KEY_FALLBACKS"] = current["old_keys"]
+        return super().get_signing_serializer(app)
+
+
+def init_app(app, connect):
+    # connect returns a database connection, for LAB_SECRETS_STORE=db.
+    global _connect
+    _connect = connect
+    app.session_interface = SessionInterface()
+
+
+def _reset_after_fork():
+    global _lock
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,191 @@
+import os, gc, sys, time, signal, socket, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Disable the cyclic GC while the app is imported so objects created during
+# setup are not touched (and their pages copied) by collections in workers.
+gc.disable()
+
+import app as lab
+import database.db as db
+import lab.boot as boot
+import lab.metrics as metrics
+import lab.profiling as profiling
+
+HOST = os.environ.get("LAB_HOST", "0.0.0.0")
+PORT = int(os.environ.get("LAB_PORT", "1303"))
+WORKERS = int(os.environ.get("LAB_WORKERS", str(os.cpu_count() or 1)))
+THREADS = int(os.environ.get("LAB_THREADS", "16"))
+BACKLOG = int(os.environ.get("LAB_BACKLOG", "2048"))
+KEEPALIVE_TIMEOUT = float(os.environ.get("LAB_KEEPALIVE_TIMEOUT", "5"))
+RESPAWN_DELAY = 1.0
+# How long the accept loop waits for a free thread before checking whether
+# it should shut down.
+SLOT_WAIT = 0.5
+
+
+class RequestHandler(WSGIRequestHandler):
+    # Idle keep-alive connections give their thread back after this long.
+    timeout = KEEPALIVE_TIMEOUT
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    multithread = True
+
+    def __init__(self, host, port, app, threads, fd=None):
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="http"
+        )
+        # A worker only accepts a connection when it has a free thread, so
+        # idle workers pick up the load instead of queueing it here.
+        self.slots = threading.BoundedSemaphore(threads)
+        super().__init__(host, port, app, handler=RequestHandler, fd=fd)
+        self.socket.setblocking(False)
+
+    def _handle_request_noblock(self):
+        if not self.slots.acquire(timeout=SLOT_WAIT):
+            # Every thread is busy; the connection stays in the backlog.
+            return
+        try:
+            request, client_address = self.get_request()
+        except OSError:
+            self.slots.release()
+            return
+        if self.verify_request(request, client_address):
+            self.executor.submit(self.process_request_thread, request, client_address)
+        else:
+            self.shutdown_request(request)
+            self.slots.release()
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.slots.release()
+
+
+def run_worker(sock):
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    profiling.install_signals(follower=True)
+    gc.enable()
+
+    server = PooledWSGIServer(HOST, PORT, lab.app, THREADS, fd=sock.fileno())
+    sock.close()
+    signal.signal(
+        signal.SIGTERM,
+        lambda *_: threading.Thread(target=server.shutdown, daemon=True).start(),
+    )
+    print(f"[INFO] Worker {os.getpid()} serving with {THREADS} threads")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        server.executor.shutdown(wait=True)
+
+
+def spawn(sock):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(sock)
+        except BaseException:
+            code = 1
+            sys.excepthook(*sys.exc_info())
+        finally:
+            sys.stdout.flush()
+            os._exit(code)
+    return pid
+
+
+def serve_embedded():
+    # The embedded database lives in this process's memory, so workers
+    # cannot be forked; one process serves with its request threads.
+    profiling.install_signals()
+    gc.enable()
+    server = PooledWSGIServer(HOST, PORT, lab.app, THREADS)
+    boot.mark_ready()
+    print(f"[INFO] Serving with {THREADS} threads and the embedded database")
+    server.serve_forever()
+
+
+def main():
+    lab.bootstrap()
+    if db.ENGINE == "sqlite":
+        return serve_embedded()
+    # Connections opened by the bootstrap must not be shared with workers.
+    db.close_pools()
+
+    # Workers publish their metrics here so /metrics covers all of them.
+    metrics.prepare_dir(
+        metrics.METRICS_DIR or tempfile.mkdtemp(prefix="sqli-lab-metrics-")
+    )
+
+    sock = socket.create_server((HOST, PORT), backlog=BACKLOG)
+    sock.set_inheritable(True)
+
+    # Workers inherit the flag, so /readyz answers as soon as they accept.
+    boot.mark_ready()
+    gc.collect()
+    gc.freeze()
+
+    workers = set()
+    stopping = False
+
+    def stop(signum, _):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def notify_workers():
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGUSR1)
+            except ProcessLookupError:
+                pass
+
+    def relay_profiling(*_):
+        profiling.reload()
+        notify_workers()
+
+    def toggle_profiling(*_):
+        profiling.toggle()
+        notify_workers()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    # Workers change profiling with SIGUSR1 to the master; an operator
+    # toggles it with SIGUSR2.
+    signal.signal(signal.SIGUSR1, relay_profiling)
+    signal.signal(signal.SIGUSR2, toggle_profiling)
+
+    for _ in range(WORKERS):
+        workers.add(spawn(sock))
+    print(f"[INFO] Serving on {HOST}:{PORT} with {WORKERS} workers x {THREADS} threads")
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"[INFO] Worker {pid} exited with status {status}, respawning...")
+            time.sleep(RESPAWN_DELAY)
+            workers.add(spawn(sock))
+
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import os, sys, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read by the lab modules at import time.
+os.environ["LAB_DB_ENGINE"] = "mysql"
+os.environ["LAB_LOG_ENABLED"] = "0"
+os.environ["LAB_SQLITE_PATH"] = "file:sqli_lab_tests?mode=memory&cache=shared"
+os.environ["LAB_SECRETS_FILE"] = os.path.join(tempfile.mkdtemp(), "secrets.json")
+
+import fakemysql
+
+# Keeps the in-memory lab database open for the whole run.
+_database = fakemysql.install()
@@ -0,0 +1,171 @@
+import sqlite3, itertools
+import mysql.connector
+import mysql.connector.aio
+import database.db as db
+import database.sqlite as sqlite
+
+# Stands in for the MySQL server, which the tests cannot start: connections
+# from mysql.connector(.aio).connect run their statements on the embedded
+# lab database instead. Session statements are accepted and ignored.
+IGNORED = ("SET ", "KILL ")
+
+# Every statement the lab sent, for tests that count queries.
+statements = []
+# Schemas that no longer exist, e.g. dropped tenants.
+missing_schemas = set()
+_ids = itertools.count(1)
+
+
+def seed():
+    conn = sqlite.Connection(sqlite.connect(writable=True))
+    sqlite.create_tables(conn)
+    sqlite.init_data(
+        conn,
+        [(username, f"{username}-password", role) for username, role in db.USERS_DATA],
+        db.BLOGS_DATA,
+        "FLAG{test}",
+    )
+    conn.commit()
+    return conn
+
+
+class Cursor:
+    def __init__(self, cnx, dictionary):
+        self._cnx = cnx
+        self._dictionary = dictionary
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        statements.append(sql)
+        self._rows = []
+        if sql.lstrip().upper().startswith(IGNORED):
+            return
+        if params:
+            sql = sql.replace("%s", "?")
+        try:
+            cursor = self._cnx.sqlite.execute(sql, params or ())
+            rows = cursor.fetchall()
+        except sqlite3.Error as e:
+            raise mysql.connector.errors.ProgrammingError(msg=str(e)) from e
+        if self._dictionary:
+            rows = [sqlite.dict_row(cursor, row) for row in rows]
+        self._rows = rows
+        self._cnx.unread_result = bool(rows)
+
+    def fetchone(self):
+        if not self._rows:
+            self._cnx.unread_result = False
+            return None
+        return self._rows.pop(0)
+
+    def fetchmany(self, size=1):
+        return [row for row in (self.fetchone() for _ in range(size)) if row]
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        self._cnx.unread_result = False
+        return rows
+
+    def close(self):
+        pass
+
+
+class Connection:
+    def __init__(self, **config):
+        self.sqlite = sqlite.connect()
+        # MySQL's SLEEP() returns 0; the tests do not wait for it.
+        self.sqlite.create_function("sleep", 1, lambda seconds: 0)
+        self.connection_id = next(_ids)
+        self.unread_result = False
+        self.closed = False
+
+    def cursor(self, dictionary=False, **kwargs):
+        return Cursor(self, dictionary)
+
+    def is_connected(self):
+        return True
+
+    def reconnect(self, attempts=1):
+        pass
+
+    def cmd_init_db(self, database):
+        if database in missing_schemas:
+            raise mysql.connector.errors.ProgrammingError(
+                msg=f"Unknown database '{database}'", errno=1049
+            )
+
+    def cmd_reset_connection(self):
+        self.unread_result = False
+        return True
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+        self.sqlite.close()
+
+    shutdown = close
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    async def execute(self, sql, params=None):
+        return self._cursor.execute(sql, params)
+
+    async def fetchone(self):
+        return self._cursor.fetchone()
+
+    async def fetchall(self):
+        return self._cursor.fetchall()
+
+    async def close(self):
+        return self._cursor.close()
+
+
+class AsyncConnection:
+    def __init__(self, cnx):
+        self._cnx = cnx
+        self.connection_id = cnx.connection_id
+
+    @property
+    def unread_result(self):
+        return self._cnx.unread_result
+
+    async def cursor(self, dictionary=False, **kwargs):
+        return AsyncCursor(self._cnx.cursor(dictionary))
+
+    async def is_connected(self):
+        return True
+
+    async def cmd_init_db(self, database):
+        self._cnx.cmd_init_db(database)
+
+    @property
+    def closed(self):
+        return self._cnx.closed
+
+    async def cmd_reset_connection(self):
+        return self._cnx.cmd_reset_connection()
+
+    async def close(self):
+        self._cnx.close()
+
+
+def connect(**config):
+    return Connection(**config)
+
+
+async def connect_async(**config):
+    return AsyncConnection(Connection(**config))
+
+
+def install():
+    mysql.connector.connect = connect
+    mysql.connector.aio.connect = connect_async
+    return seed()
@@ -0,0 +1,67 @@
+import flask
+import pytest
+import lab.admission as admission
+
+FLOOD = 60
+BURST = admission.LIMITS["sqli_basic"][1]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(admission, "ENABLED", True)
+    admission._reset_after_fork()
+    app = flask.Flask(__name__)
+    app.secret_key = "test"
+
+    @app.route("/sqli/basic", methods=["POST"])
+    def sqli_basic():
+        return "ok"
+
+    admission.init_app(app, lambda: flask.request.headers.get("X-Lab-Team"))
+    yield app.test_client
+    admission._reset_after_fork()
+
+
+def flood(client, headers=lambda i: {}, address=lambda i: "10.0.0.1", count=FLOOD):
+    statuses = []
+    for i in range(count):
+        # A new client every time: no cookie is ever sent back.
+        response = client().post(
+            "/sqli/basic",
+            headers=headers(i),
+            environ_base={"REMOTE_ADDR": address(i)},
+        )
+        statuses.append(response.status_code)
+    return statuses
+
+
+def test_cookieless_flood_is_limited(client):
+    statuses = flood(client)
+    assert statuses.count(200) <= BURST + 1
+    assert statuses.count(429) >= FLOOD - BURST - 1
+
+
+def test_rotating_team_header_is_limited(client, monkeypatch, capsys):
+    monkeypatch.setattr(admission, "TEAMS_PER_ADDRESS", 2)
+    statuses = flood(client, headers=lambda i: {"X-Lab-Team": f"team{i}"})
+    assert statuses.count(200) <= 2 * BURST + 1
+    assert "LAB_ADMISSION_TEAMS_PER_ADDRESS" in capsys.readouterr().out
+
+
+def test_teams_behind_one_address_keep_their_own_budget(client):
+    for team in range(10):
+        statuses = flood(
+            client, headers=lambda i: {"X-Lab-Team": f"team{team}"}, count=BURST
+        )
+        assert statuses.count(200) == BURST
+
+
+def test_other_addresses_keep_their_budget(client):
+    flood(client)
+    response = client().post("/sqli/basic", environ_base={"REMOTE_ADDR": "10.0.0.2"})
+    assert response.status_code == 200
+
+
+def test_proxied_requests_are_reported(client, capsys):
+    client().post("/sqli/basic", headers={"X-Forwarded-For": "192.0.2.7"})
+    assert "proxy" in capsys.readouterr().out
@@ -0,0 +1,39 @@
+import asyncio
+import mysql.connector
+import pytest
+import database.aio as aio
+import database.db as db
+import fakemysql
+import lab.metrics as metrics
+
+SCHEMA = "sqli_lab_t_dropped"
+
+
+def gauge(pool, state):
+    key = ("lab_db_pool_connections", (*pool.labels, ("state", state)))
+    return metrics.snapshot()["gauges"].get(key, 0)
+
+
+def test_dropped_tenant_schema_closes_the_connection():
+    async def scenario():
+        pool = aio.AsyncPool(1, 1, "dropped", db.BACKENDS[0])
+        cnx = await pool.get_connection(SCHEMA)
+        await pool.release(cnx)
+        assert pool.idle == [cnx] and gauge(pool, "open") == 1
+
+        fakemysql.missing_schemas.add(SCHEMA)
+        try:
+            with pytest.raises(mysql.connector.errors.ProgrammingError):
+                await pool.get_connection(SCHEMA)
+            assert cnx.closed
+            assert pool.idle == [] and gauge(pool, "open") == 0
+            # The slot came back: a new connection does not wait.
+            with pytest.raises(mysql.connector.errors.ProgrammingError):
+                await pool.get_connection(SCHEMA)
+            assert gauge(pool, "open") == 0
+        finally:
+            fakemysql.missing_schemas.discard(SCHEMA)
+        await pool.release(await pool.get_connection(SCHEMA))
+        assert gauge(pool, "open") == 1 and gauge(pool, "in_use") == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,28 @@
+import jinja2
+import pytest
+import app as lab
+import lab.assets as assets
+
+
+def test_minify_keeps_descendant_pseudo_classes():
+    css = "form :focus { color : red; }\n.card :hover { margin: 0 auto; }"
+    assert assets.minify(css) == "form :focus{color:red}.card :hover{margin:0 auto}"
+
+
+def test_minify_inside_media_queries():
+    css = "@media (max-width: 600px) { .card :hover { padding: 0; } }"
+    assert assets.minify(css) == "@media (max-width: 600px){.card :hover{padding:0}}"
+
+
+def test_every_linked_stylesheet_is_bundled():
+    assets.check_templates(lab.app.jinja_env)
+
+
+def test_unbundled_stylesheet_is_refused():
+    env = jinja2.Environment(
+        loader=jinja2.DictLoader(
+            {"page.html": "{{ url_for('static', filename='extra.css') }}"}
+        )
+    )
+    with pytest.raises(RuntimeError):
+        assets.check_templates(env)
@@ -0,0 +1,30 @@
+import app as lab
+import fakemysql
+import lab.admission as admission
+import lab.pagecache as pagecache
+
+
+def executed(sql):
+    return sum(statement == sql for statement in fakemysql.statements)
+
+
+def test_time_based_results_are_never_cached(monkeypatch):
+    monkeypatch.setattr(admission, "ENABLED", False)
+    pagecache.clear()
+    sql = "SELECT * FROM users WHERE username = 'admin'"
+    before = executed(sql)
+    client = lab.app.test_client()
+    for _ in range(3):
+        assert client.get("/sqli/time?search=admin").status_code == 200
+    # Each probe has to reach the database, or SLEEP() payloads return at once.
+    assert executed(sql) == before + 3
+
+
+def test_static_pages_are_cached(monkeypatch):
+    monkeypatch.setattr(admission, "ENABLED", False)
+    pagecache.clear()
+    client = lab.app.test_client()
+    client.get("/sqli/time")
+    hits = pagecache.stats()["hit"]
+    assert client.get("/sqli/time").status_code == 200
+    assert pagecache.stats()["hit"] == hits + 1
@@ -0,0 +1,11 @@
+import asyncio
+import asgi
+import bench.parity as parity
+import lab.admission as admission
+
+
+def test_asgi_renders_the_same_pages(monkeypatch):
+    # The async routes must really be served natively to be compared.
+    assert asgi.VIEWS
+    monkeypatch.setattr(admission, "ENABLED", False)
+    assert asyncio.run(parity.run(list(parity.CASES))) == {}
@@ -0,0 +1,22 @@
+import lab.sandbox as sandbox
+
+
+def test_failed_starts_are_retried(monkeypatch, capsys):
+    attempts = []
+
+    class Worker:
+        def __init__(self):
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise BlockingIOError(11, "Resource temporarily unavailable")
+
+    monkeypatch.setattr(sandbox, "Worker", Worker)
+    monkeypatch.setattr(sandbox, "RESPAWN_DELAY", 0.01)
+    pool = sandbox.Pool(0)
+    pool.size = pool.starting = 1
+    pool._replace()
+
+    assert len(attempts) == 3
+    assert pool.stats() == {"workers": 1, "idle": 1, "busy": 0, "starting": 0}
+    assert isinstance(pool.checkout(0.1), Worker)
+    assert capsys.readouterr().out.count("Could not start a sandbox worker") == 2
@@ -0,0 +1,42 @@
+import database.reset as reset
+import database.search as search
+import database.tenants as tenants
+
+STOPWORDS_OFF = "SET SESSION innodb_ft_enable_stopword = OFF"
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+
+    def fetchall(self):
+        return [("title",)]
+
+
+def stopwords_off_before_copies(copy):
+    cursor = RecordingCursor()
+    copy(cursor)
+    creates = [i for i, sql in enumerate(cursor.statements) if "LIKE `" in sql]
+    assert creates
+    return STOPWORDS_OFF in cursor.statements[: creates[0]]
+
+
+def test_reset_copies_keep_every_ngram():
+    assert stopwords_off_before_copies(
+        lambda cursor: reset.copy_tables(cursor, "sqli_lab", reset.SPARE_SCHEMA)
+    )
+
+
+def test_tenant_clones_keep_every_ngram():
+    assert stopwords_off_before_copies(
+        lambda cursor: tenants.clone(cursor, "sqli_lab_t_test")
+    )
+
+
+def test_payloads_keep_the_plain_statement(monkeypatch):
+    monkeypatch.setattr(search, "ENABLED", True)
+    assert search.title_filter("Data Science").startswith("MATCH(title)")
+    assert search.title_filter("' or 1=1 -- -") == "title LIKE '%' or 1=1 -- -%'"
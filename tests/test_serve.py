@@ -0,0 +1,22 @@
+import gc, socket, threading
+import serve
+
+# serve turns the collector off while the app is imported, for its workers.
+gc.enable()
+
+
+def test_shutdown_while_every_thread_is_busy():
+    server = serve.PooledWSGIServer("127.0.0.1", 0, serve.lab.app, 1)
+    # The only thread is taken, e.g. by a SLEEP() payload.
+    server.slots.acquire()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    client = socket.create_connection(server.server_address)
+    try:
+        server.shutdown()
+        thread.join(serve.SLOT_WAIT * 4)
+        assert not thread.is_alive()
+    finally:
+        client.close()
+        server.server_close()
+        server.executor.shutdown()